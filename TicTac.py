@@ -1,6 +1,11 @@
 from enum import Enum
-import datetime
+from concurrent.futures import ProcessPoolExecutor
+import bisect
+import mmap
+import os
 import random
+import struct
+import time
 
 """Constants"""
 PLAYER = 'X'
@@ -9,6 +14,12 @@ EMPTY = '_'
 BOARD_SIZE = 5
 NUMBER_OF_PLAYERS = 1
 SEARCH_TIME = 5
+TABLE_SIZE = 2 ** 20
+ZOBRIST_SEED = 2020
+SHOW_SEARCH_STATS = False
+NUMBER_OF_WORKERS = 1
+BOOK_FILE = 'tictac_book_{}.bin'
+CHECK_INTERVAL = 256  # the search checks the clock once in this number of nodes, must be power of 2
 
 """exception class, in case the user entered a none empty position"""
 
@@ -22,6 +33,20 @@ class NoneEmptyPosition(Exception):
 class OutOfRange(Exception):
     pass
 
+"""exception class, in case the search time passed in the middle of a search"""
+
+
+class SearchTimeout(Exception):
+    pass
+
+""" enum for the bound type of a transposition table entry"""
+
+class Bound(Enum):
+    exact = 0
+    lower = 1  # the real score is at least the stored score
+    upper = 2  # the real score is at most the stored score
+
+
 """ enum for game state"""
 
 class GameState(Enum):
@@ -33,6 +58,8 @@ class GameState(Enum):
 
 """
 this class managing the board game activities
+the board is kept as two bitboards, one int mask per side, where bit number
+'position' is set when the matching rubric is taken
 """
 
 
@@ -42,21 +69,200 @@ class Board:
         the constructor gets 1 argumnet size - the size of the board
         it initialized the game board to be empty board (size x size)
         and store the last move which been made in order to decide who won
+        it also precompute the mask of every line (rows, columns and the two diagonals)
+        and for every position the lines which pass through it
+        every line keeps a code of its 'X' and 'O' counts - oSum * (size + 1) + xSum,
+        and the board keeps a running score which is the sum of the lines scores
+        the zobrist hash is kept for all the 8 symmetries of the board (rotations and reflections),
+        mHashes[t] is the hash of the board after it was moved by the symmetry mSymmetries[t]
+        a line is live while only one side (or none) has rubrics on it, mLiveMask keeps the rubrics
+        which are on at least one live line and mCodeCounts counts the lines of every code
+        so threats (a line which miss one rubric) are known without scanning the board
         """
     def __init__(self, size):
         self.mSize = size
-        self.mBoard = [[EMPTY for x in range(size)] for y in range(size)]
+        self.mXMask = 0
+        self.mOMask = 0
+        self.mFullMask = (1 << (size * size)) - 1
         self.lastMove = None
+        self.mLines = self.computeLines(size)
+        self.mLineMasks = [self.lineToMask(line) for line in self.mLines]
+        self.mCellLines = [[] for i in range(size * size)]
+        for index, line in enumerate(self.mLines):
+            for position in line:
+                self.mCellLines[position].append(index)
+        self.mCellLineMasks = [[self.mLineMasks[index] for index in lines] for lines in self.mCellLines]
+        zobrist = random.Random(ZOBRIST_SEED + size)
+        self.mZobristX = [zobrist.getrandbits(64) for i in range(size * size)]
+        self.mZobristO = [zobrist.getrandbits(64) for i in range(size * size)]
+        self.mZobristSide = zobrist.getrandbits(64)
+        self.mSymmetries = self.computeSymmetries(size)
+        self.mInverseSymmetries = [[0] * (size * size) for symmetry in self.mSymmetries]
+        for t, symmetry in enumerate(self.mSymmetries):
+            for position, moved in enumerate(symmetry):
+                self.mInverseSymmetries[t][moved] = position
+        self.mSymmetryKeysX = [[self.mZobristX[symmetry[position]] for symmetry in self.mSymmetries]
+                               for position in range(size * size)]
+        self.mSymmetryKeysO = [[self.mZobristO[symmetry[position]] for symmetry in self.mSymmetries]
+                               for position in range(size * size)]
+        self.mHashes = [0] * len(self.mSymmetries)
+        self.mLineCodes = [0] * len(self.mLines)
+        self.mLineScores = [0] * (size + 1) ** 2
+        self.mScore = 0
+        self.mLineAlive = [code // (size + 1) == 0 or code % (size + 1) == 0 for code in range((size + 1) ** 2)]
+        self.mCodeCounts = [0] * (size + 1) ** 2
+        self.mCodeCounts[0] = len(self.mLines)
+        self.mLiveCounts = [len(lines) for lines in self.mCellLines]
+        self.mLiveMask = self.mFullMask
+        self.mThreatCodeX = size - 1
+        self.mThreatCodeO = (size - 1) * (size + 1)
+        self.mWinCodeX = size
+        self.mWinCodeO = size * (size + 1)
+
+    """this function gets the board size and return all the winning lines of the board
+            as lists of positions - the rows, the columns, the main diagonal and the secondary diagonal"""
+    @staticmethod
+    def computeLines(size):
+        lines = []
+        for i in range(size):
+            lines.append([i * size + j for j in range(size)])
+        for j in range(size):
+            lines.append([i * size + j for i in range(size)])
+        lines.append([i * size + i for i in range(size)])
+        lines.append([(size - 1 - i) * size + i for i in range(size)])
+        return lines
+
+    """this function gets the board size and return the 8 symmetries of the board,
+            every symmetry is a list which map every position to its position after the move,
+            the first one is the identity"""
+    @staticmethod
+    def computeSymmetries(size):
+        last = size - 1
+        transforms = [lambda r, c: (r, c),
+                      lambda r, c: (c, last - r),
+                      lambda r, c: (last - r, last - c),
+                      lambda r, c: (last - c, r),
+                      lambda r, c: (r, last - c),
+                      lambda r, c: (last - r, c),
+                      lambda r, c: (c, r),
+                      lambda r, c: (last - c, last - r)]
+        symmetries = []
+        for transform in transforms:
+            symmetry = []
+            for position in range(size * size):
+                row, column = transform(position // size, position % size)
+                symmetry.append(row * size + column)
+            symmetries.append(symmetry)
+        return symmetries
+
+    """this function return the zobrist hash of the board"""
+    def getHash(self):
+        return self.mHashes[0]
+
+    """this function return the canonical hash of the board - the smallest hash of its symmetries,
+            and the index of the symmetry which gives it, symmetric boards have the same canonical hash"""
+    def getCanonicalHash(self):
+        key = min(self.mHashes)
+        return key, self.mHashes.index(key)
+
+    """this function gets a position and a symmetry index and return the position after the symmetry"""
+    def toCanonical(self, position, symmetry):
+        return self.mSymmetries[symmetry][position]
+
+    """this function gets a position moved by a symmetry and the symmetry index
+            and return the original position"""
+    def fromCanonical(self, position, symmetry):
+        return self.mInverseSymmetries[symmetry][position]
+
+    """this function gets a function which calculate a line score from its 'O' and 'X' counts
+            and use it to build the lines scores table of the running score"""
+    def setLineScores(self, scoreCounts):
+        size = self.mSize
+        self.mLineScores = [scoreCounts(code // (size + 1), code % (size + 1)) for code in range((size + 1) ** 2)]
+        self.mScore = sum(self.mLineScores[code] for code in self.mLineCodes)
+
+    """this function gets a line index and return the number of 'O' and 'X' on it"""
+    def getLineCounts(self, index):
+        return divmod(self.mLineCodes[index], self.mSize + 1)
+
+    """this function gets position and the change of the lines codes
+            and update the codes and the running score of the lines through the position"""
+    def updateLines(self, position, step):
+        codes = self.mLineCodes
+        scores = self.mLineScores
+        alive = self.mLineAlive
+        counts = self.mCodeCounts
+        score = self.mScore
+        for index in self.mCellLines[position]:
+            code = codes[index]
+            newCode = code + step
+            score += scores[newCode] - scores[code]
+            codes[index] = newCode
+            counts[code] -= 1
+            counts[newCode] += 1
+            if alive[code] != alive[newCode]:
+                self.updateLiveLine(index, alive[newCode])
+        self.mScore = score
+
+    """this function gets a line index and if the line became live or dead
+            and update the number of live lines through its rubrics and the live mask"""
+    def updateLiveLine(self, index, alive):
+        change = 1 if alive else -1
+        for position in self.mLines[index]:
+            self.mLiveCounts[position] += change
+            if self.mLiveCounts[position] == 0:
+                self.mLiveMask &= ~(1 << position)
+            elif alive and self.mLiveCounts[position] == 1:
+                self.mLiveMask |= 1 << position
+
+    """this function gets char - 'X' or 'O' and return the empty rubrics which complete a line of the char"""
+    def getThreatCells(self, char):
+        code = self.mThreatCodeX if char == PLAYER else self.mThreatCodeO
+        if not self.mCodeCounts[code]:
+            return []
+        empty = self.getEmptyMask()
+        cells = []
+        for index, lineCode in enumerate(self.mLineCodes):
+            if lineCode == code:
+                cell = (self.mLineMasks[index] & empty).bit_length() - 1
+                if cell not in cells:
+                    cells.append(cell)
+        return cells
+
+    """this function return the empty rubrics which are on at least one live line"""
+    def getLivePositions(self):
+        positions = []
+        live = self.getEmptyMask() & self.mLiveMask
+        while live:
+            lowBit = live & -live
+            positions.append(lowBit.bit_length() - 1)
+            live ^= lowBit
+        return positions
+
+    """this function gets the masks of 'X' and 'O' and the last move
+            and set the board to this position"""
+    def setPosition(self, xMask, oMask, lastMove):
+        for position in range(self.mSize ** 2):
+            self.drawEmpty(position)
+        for position in range(self.mSize ** 2):
+            if xMask >> position & 1:
+                self.drawX(position)
+            elif oMask >> position & 1:
+                self.drawO(position)
+        self.lastMove = lastMove
+
+    """this function gets list of positions and return them as bit mask"""
+    @staticmethod
+    def lineToMask(line):
+        mask = 0
+        for position in line:
+            mask |= 1 << position
+        return mask
 
     """this function prints the game board"""
     def print(self):
         for i in range(self.mSize):
-            for j in range(self.mSize):
-                if j < self.mSize-1:
-                    print(self.mBoard[i][j], end='|')
-                else:
-                    print(self.mBoard[i][j], end='')
-            print()
+            print('|'.join(self.getRow(i)))
 
     """this function gets position 0 - size x size
             and convert it to a board position
@@ -70,36 +276,34 @@ class Board:
     def getLastMove(self):
         return self.lastMove
 
+    """this function gets position and return the char which drawn on it"""
+    def getRubric(self, position):
+        bit = 1 << position
+        if self.mXMask & bit:
+            return PLAYER
+        if self.mOMask & bit:
+            return COMPUTER
+        return EMPTY
+
     """this function gets number of row in the board and return the match row"""
     def getRow(self, numberOfRow):
-        return self.mBoard[numberOfRow]
+        return [self.getRubric(position) for position in self.mLines[numberOfRow]]
 
     """this function gets number of column in the board and return the match column"""
     def getColumn(self, numberOFColumn):
-        return [row[numberOFColumn] for row in self.mBoard]
+        return [self.getRubric(position) for position in self.mLines[self.mSize + numberOFColumn]]
 
     """this function return the diagonals of the board"""
     def getDiagonal(self):
-        diagonal1 = [self.mBoard[i][i] for i in range(self.mSize)]
-        diagonal2 = []
-        j = 0
-        for i in reversed(range(self.mSize)):
-            diagonal2.append(self.mBoard[i][j])
-            j += 1
-        return diagonal1, diagonal2
+        return self.getMainDiagonal(), self.getSecondaryDiagonal()
 
     """this function return the main diagonal of the board, left to right"""
     def getMainDiagonal(self):
-        return [self.mBoard[i][i] for i in range(self.mSize)]
+        return [self.getRubric(position) for position in self.mLines[2 * self.mSize]]
 
     """this function return the secondary diagonal of the board, right to left"""
     def getSecondaryDiagonal(self):
-        diagonal = []
-        j = 0
-        for i in reversed(range(self.mSize)):
-            diagonal.append(self.mBoard[i][j])
-            j += 1
-        return diagonal
+        return [self.getRubric(position) for position in self.mLines[2 * self.mSize + 1]]
 
     """this function gets position and checking if the position is on the main diagonal"""
     def checkIfOnMainDiagonal(self, position):
@@ -112,41 +316,246 @@ class Board:
     """this function gets position and draw 'X' on the match place on the board"""
     def drawX(self, position):
         self.lastMove = position
-        (row, column) = self.getBoardPosition(position)
-        self.mBoard[row][column] = PLAYER
+        self.mXMask |= 1 << position
+        self.mHashes = [key ^ move for key, move in zip(self.mHashes, self.mSymmetryKeysX[position])]
+        self.updateLines(position, 1)
 
     """this function gets position and draw '_' on the match place on the board"""
     def drawEmpty(self, position):
-        (row, column) = self.getBoardPosition(position)
-        self.mBoard[row][column] = EMPTY
+        bit = 1 << position
+        if self.mXMask & bit:
+            self.mXMask ^= bit
+            self.mHashes = [key ^ move for key, move in zip(self.mHashes, self.mSymmetryKeysX[position])]
+            self.updateLines(position, -1)
+        elif self.mOMask & bit:
+            self.mOMask ^= bit
+            self.mHashes = [key ^ move for key, move in zip(self.mHashes, self.mSymmetryKeysO[position])]
+            self.updateLines(position, -(self.mSize + 1))
 
     """this function gets position and draw 'O' on the match place on the board"""
     def drawO(self, position):
         self.lastMove = position
-        (row, column) =  self.getBoardPosition(position)
-        self.mBoard[row][column] = COMPUTER
+        self.mOMask |= 1 << position
+        self.mHashes = [key ^ move for key, move in zip(self.mHashes, self.mSymmetryKeysO[position])]
+        self.updateLines(position, self.mSize + 1)
 
     """this function gets position and checking if it empty"""
     def checkIfRubricEmpty(self, position):
-        (row, column) = self.getBoardPosition(position)
-        return self.mBoard[row][column] == EMPTY
+        return not (self.mXMask | self.mOMask) >> position & 1
 
     """this function gets 2 arguments:  listToBeChecked - line in the board 
             char - 'X' or 'Y' and checking if all the line filled with it"""
     def all_same(self, listToBeChecked, char):
         return all(x == char for x in listToBeChecked)
 
+    """this function gets char - 'X' or 'O' and return the mask of its rubrics"""
+    def getMask(self, char):
+        return self.mXMask if char == PLAYER else self.mOMask
+
+    """this function gets char and position and checking if one of the lines
+            which pass through the position is filled with the char"""
+    def checkLinesThrough(self, char, position):
+        mask = self.getMask(char)
+        for lineMask in self.mCellLineMasks[position]:
+            if mask & lineMask == lineMask:
+                return True
+        return False
+
+    """this function checking if all the rubrics of the board are taken"""
+    def isFull(self):
+        return self.mXMask | self.mOMask == self.mFullMask
+
+    """this function return the mask of the empty rubrics"""
+    def getEmptyMask(self):
+        return ~(self.mXMask | self.mOMask) & self.mFullMask
+
+    """this function return the empty positions of the board from low to high"""
+    def getEmptyPositions(self):
+        positions = []
+        empty = self.getEmptyMask()
+        while empty:
+            lowBit = empty & -empty
+            positions.append(lowBit.bit_length() - 1)
+            empty ^= lowBit
+        return positions
+
+
+"""
+this class store search results by the zobrist hash of the position
+it is a fixed size table, every hash is mapped to one slot,
+a slot is replaced when the new result searched at least as deep as the stored one
+or when it belongs to the same position
+"""
+
+
+class TranspositionTable:
+
+    """the constructor gets 1 argument size - the number of slots in the table"""
+    def __init__(self, size):
+        self.mSize = size
+        self.mSlots = [None] * size
+
+    """this function gets a hash and return the stored entry
+            (hash, depth, bound, score, move) or None if the position is not stored"""
+    def lookup(self, key):
+        entry = self.mSlots[key % self.mSize]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    """this function gets a hash, the depth of the search, the bound type,
+            the score and the best move and store them"""
+    def store(self, key, depth, bound, score, move):
+        index = key % self.mSize
+        entry = self.mSlots[index]
+        if entry is None or entry[0] == key or depth >= entry[1]:
+            self.mSlots[index] = (key, depth, bound, score, move)
+
+    """this function empty the table"""
+    def clear(self):
+        self.mSlots = [None] * self.mSize
+
+
+"""
+this class is an opening book - a file of the best computer moves for the first positions of the game,
+the file starts with a header (magic, version, board size, zobrist seed, number of entries)
+and than the entries sorted by the canonical hash of the position, every entry is
+the hash (8 bytes) and the move in the canonical board (2 bytes),
+the file is memory mapped and searched with binary search so it is never read whole
+"""
+
+
+class OpeningBook:
+    MAGIC = b'TTBK'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHHII')
+    ENTRY = struct.Struct('<QH')
+
+    """the constructor gets 1 argument path - the book file"""
+    def __init__(self, path):
+        self.mFile = open(path, 'rb')
+        self.mMap = mmap.mmap(self.mFile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.mSize, self.mSeed, self.mCount = self.HEADER.unpack_from(self.mMap, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            raise ValueError(path + ' is not an opening book')
+        self.mKeys = BookKeys(self)
+
+    """this function gets the board size and return the book of the board or None if there is no book,
+            books which were made with other zobrist keys are ignored"""
+    @staticmethod
+    def load(size):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), BOOK_FILE.format(size))
+        if not os.path.exists(path):
+            return None
+        book = OpeningBook(path)
+        if book.mSize != size or book.mSeed != ZOBRIST_SEED:
+            book.close()
+            return None
+        return book
+
+    """this function gets the index of an entry and return its hash and move"""
+    def getEntry(self, index):
+        return self.ENTRY.unpack_from(self.mMap, self.HEADER.size + index * self.ENTRY.size)
+
+    """this function gets a canonical hash and return the canonical move stored for it or None"""
+    def lookup(self, key):
+        index = bisect.bisect_left(self.mKeys, key)
+        if index < self.mCount:
+            entryKey, move = self.getEntry(index)
+            if entryKey == key:
+                return move
+        return None
+
+    """this function gets the path, the board size and dictionary of canonical hash to canonical move
+            and write them as a book file"""
+    @staticmethod
+    def write(path, size, moves):
+        with open(path, 'wb') as bookFile:
+            bookFile.write(OpeningBook.HEADER.pack(OpeningBook.MAGIC, OpeningBook.VERSION,
+                                                   size, ZOBRIST_SEED, len(moves)))
+            for key in sorted(moves):
+                bookFile.write(OpeningBook.ENTRY.pack(key, moves[key]))
+
+    """this function close the book file"""
+    def close(self):
+        self.mMap.close()
+        self.mFile.close()
+
+
+"""this class let bisect search the hashes of the book entries without reading them to a list"""
+
+
+class BookKeys:
+
+    def __init__(self, book):
+        self.mBook = book
+
+    def __len__(self):
+        return self.mBook.mCount
+
+    def __getitem__(self, index):
+        return self.mBook.getEntry(index)[0]
+
+
+"""
+this class control the time of a search, it keeps a deadline on the monotonic clock
+and the search calls check once in CHECK_INTERVAL nodes, when the deadline passed
+check raise SearchTimeout which stop the search
+"""
+
+
+class SearchController:
+
+    """the constructor gets 1 argument timeLimit - the search time in seconds, None for no time limit"""
+    def __init__(self, timeLimit=None):
+        self.start(timeLimit)
+
+    """this function gets the search time in seconds (None for no time limit) and start the clock"""
+    def start(self, timeLimit):
+        self.mStartTime = time.monotonic()
+        self.mTimeLimit = timeLimit
+        self.mDeadline = float('inf') if timeLimit is None else self.mStartTime + timeLimit
+
+    """this function raise SearchTimeout if the deadline passed"""
+    def check(self):
+        if time.monotonic() >= self.mDeadline:
+            raise SearchTimeout()
+
+    """this function checking if the deadline passed"""
+    def expired(self):
+        return time.monotonic() >= self.mDeadline
+
+    """this function return the seconds since the search started"""
+    def elapsed(self):
+        return time.monotonic() - self.mStartTime
+
+    """this function return the seconds left until the deadline, None if there is no time limit"""
+    def remaining(self):
+        if self.mTimeLimit is None:
+            return None
+        return max(0.0, self.mDeadline - time.monotonic())
+
+    """this function return the part of the time limit which was used, 0 if there is no time limit"""
+    def budgetUsed(self):
+        if not self.mTimeLimit:
+            return 0
+        return self.elapsed() / self.mTimeLimit
+
 
 """this class handling all the game Activities"""
 
 
 class Game:
     """the constructor gets 2 arguments: numberOfPlayers, board size
+        and optional workers - the number of processes the search use, 1 means searching in this process
+        mLeafEvaluator - optional function (board, moves, isMax) which return the leaf scores of all the moves
+        at once, like tictac_batch.BatchEvaluator.scoreChildren, None means the leaves are scored one by one
         also, mNamesList - store the names of the players
         mTurn - says who have the turn to play, even -player1, odd - player2
         mComputerFirstPosition - store the random position of the computer"""
 
-    def __init__(self, numberOfPlayers, boardSize):
+    def __init__(self, numberOfPlayers, boardSize, workers=NUMBER_OF_WORKERS):
         self.mBoard = Board(boardSize)
         self.mBoardSize = boardSize
         self.mNumberOfPlayers = numberOfPlayers
@@ -155,7 +564,26 @@ class Game:
         self.mComputerFirstPosition = None
         self.coinFlip()
         self.mBestMove = 0
-
+        self.mTable = TranspositionTable(TABLE_SIZE)
+        self.mBoard.setLineScores(self.getScoreCounts)
+        size = self.mBoard.mSize
+        center = (size - 1) / 2
+        self.mCenterBonus = [size - abs(row - center) - abs(column - center)
+                             for row in range(size) for column in range(size)]
+        self.mKillers = []
+        self.mHistory = [0] * (size * size)
+        self.mPrincipalMove = None
+        self.mNodes = 0
+        self.mSearchStats = []
+        self.mSearchTime = 0
+        self.mSearchSource = 'search'
+        self.mLeafEvaluator = None
+        self.mController = SearchController()
+        self.mCheckMask = CHECK_INTERVAL - 1
+        self.mInfinity = 10 ** (size + 2)
+        self.mWorkers = workers
+        self.mExecutor = None
+        self.mBook = OpeningBook.load(boardSize)
 
     """this function decide who is starting the game by coin flip,
             if the computer won it choose random Move for the first move"""
@@ -217,36 +645,46 @@ class Game:
         else:
             char = 'O'
         lastMove = self.mBoard.getLastMove()
-        row, col = self.mBoard.getBoardPosition(lastMove)
-
-        if self.mBoard.all_same(self.mBoard.getRow(row), char) or \
-                self.mBoard.all_same(self.mBoard.getColumn(col), char):
-            return True
-
-        if self.mBoard.checkIfOnMainDiagonal(lastMove):
-            if self.mBoard.all_same(self.mBoard.getMainDiagonal(), char):
-                return True
-
-        if self.mBoard.checkIfOnSecondaryDiagonal(lastMove):
-            if self.mBoard.all_same(self.mBoard.getSecondaryDiagonal(), char):
-                return True
-
-        return False
+        if lastMove is None:
+            return False
+        return self.mBoard.checkLinesThrough(char, lastMove)
 
     """this function check if the game is tie, which means the board is filled and there is no winner"""
     def checkForTie(self):
-        for i in range(self.mBoard.mSize ** 2):
-            if self.mBoard.checkIfRubricEmpty(i):
-                return False
-        return True
+        return self.mBoard.isFull()
 
     """this function compute all the valid moves on the game board and return them"""
     def genrate(self):
-        possibleMoves = []
-        for i in range(self.mBoard.mSize ** 2):
-            if self.mBoard.checkIfRubricEmpty(i):
-                possibleMoves.append(i)
-        return possibleMoves
+        return self.mBoard.getEmptyPositions()
+
+    """this function gets the side which moves (True for the computer) and return the moves worth searching:
+        a move which wins at once, or else the moves which block a line the other side is about to complete,
+        or else the empty rubrics on live lines - a rubric which is only on dead lines can't change the game
+        (if all the lines are dead any move is as good as the others so only one is returned)"""
+    def genrateCandidates(self, isMax):
+        board = self.mBoard
+        own, other = (COMPUTER, PLAYER) if isMax else (PLAYER, COMPUTER)
+        wins = board.getThreatCells(own)
+        if wins:
+            return wins[:1]
+        blocks = board.getThreatCells(other)
+        if blocks:
+            return blocks
+        moves = board.getLivePositions()
+        if not moves:
+            moves = board.getEmptyPositions()[:1]
+        return moves
+
+    """this function return the move the computer must play without searching or None:
+        a move which wins at once or the only move which block the player from winning"""
+    def getForcedMove(self):
+        wins = self.mBoard.getThreatCells(COMPUTER)
+        if wins:
+            return wins[0]
+        blocks = self.mBoard.getThreatCells(PLAYER)
+        if len(blocks) == 1:
+            return blocks[0]
+        return None
 
     """this function check the game state and return it"""
     def checkGameState(self):
@@ -277,6 +715,8 @@ class Game:
                     self.mComputerFirstPosition = None
                 else:
                     computerMove = self.iterativeDeepSearch()
+                    if SHOW_SEARCH_STATS:
+                        self.printSearchStats()
 
                 self.mBoard.drawO(computerMove)
 
@@ -293,84 +733,337 @@ class Game:
                 break
 
             self.mTurn += 1
-
-    """ this function gets 6 arguments: depth - the depth of the game tree
+        self.close()
+
+    """this function stop the worker processes of the parallel search"""
+    def close(self):
+        if self.mExecutor is not None:
+            self.mExecutor.shutdown()
+            self.mExecutor = None
+        if self.mBook is not None:
+            self.mBook.close()
+            self.mBook = None
+
+    """ this function gets 5 arguments: depth - the depth of the game tree
         isMax - tell which side are we, the maximizer or the minimizer
         alpha - store the best value for the maximizer
         beta - store the best value for the minimizer
-        startTime - the time we started the search
-        timeLimit - the time we will search for the best move
+        ply - how many moves were made since the root of the search
         the function tells if the moves I take is better or worse by compute the best score
         and position in the given depth, than it return them
-        I used minmax algorithm with alpha beta pruning"""
-    def minmax2(self, depth, isMax, alpha, beta, startTime, timeLimit):
-
-        moves = self.genrate()
-        score = self.evaluate()
+        the time is checked by mController once in CHECK_INTERVAL nodes,
+        when it passed SearchTimeout is raised and the board is left as it was in the middle of the search
+        I used minmax algorithm with alpha beta pruning,
+        positions which were already searched deep enough are taken from the transposition table,
+        the table is keyed by the canonical hash so symmetric positions share their entry,
+        and the moves are searched in the order of orderMoves"""
+    def minmax2(self, depth, isMax, alpha, beta, ply=0):
+        self.mNodes += 1
+        if not self.mNodes & self.mCheckMask:
+            self.mController.check()
         position = None
+        key, symmetry = self.mBoard.getCanonicalHash()
+        if isMax:
+            key ^= self.mBoard.mZobristSide
+        entry = self.mTable.lookup(key)
+        tableMove = None
+        if entry is not None and entry[4] is not None:
+            tableMove = self.mBoard.fromCanonical(entry[4], symmetry)
+        if entry is not None:
+            if entry[1] >= depth:
+                if entry[2] == Bound.exact:
+                    return entry[3], tableMove
+                if entry[2] == Bound.lower:
+                    alpha = max(alpha, entry[3])
+                elif entry[2] == Bound.upper:
+                    beta = min(beta, entry[3])
+                if alpha >= beta:
+                    return entry[3], tableMove
 
-        if datetime.datetime.now() - startTime >= timeLimit:
-            self.mTimePassed = True
+        board = self.mBoard
+        if board.mCodeCounts[board.mWinCodeX]:
+            return -10**(board.mSize+1), position
+        elif board.mCodeCounts[board.mWinCodeO]:
+            return 10**(board.mSize+1), position
+        elif board.isFull():
+            return 0, position
 
-        if not moves or depth == 0 or self.mTimePassed:
-            gameResult = self.checkGameState()
-            if gameResult.value == 'X':
-                return -10**(self.mBoard.mSize+1), position
-            elif gameResult.value == 'O':
-                return 10**(self.mBoard.mSize+1), position
-            elif gameResult.value == 'Tie':
-                return 0, position
+        if depth == 0:
+            return self.evaluate(), position
+
+        moves = self.genrateCandidates(isMax)
 
-            return score, position
+        if ply == 0 and self.mPrincipalMove is not None:
+            tableMove = self.mPrincipalMove
+        moves = self.orderMoves(moves, isMax, ply, tableMove)
 
+        leafScores = None
+        if depth == 1 and self.mLeafEvaluator is not None:
+            # the children are leaves, score all of them in one batch
+            leafScores = dict(zip(moves, self.mLeafEvaluator(self.mBoard, moves, isMax)))
+            self.mNodes += len(moves)
+
+        alphaOrig = alpha
+        betaOrig = beta
         if isMax:
             for i in moves:
-                    self.mBoard.drawO(i)
-                    score, dummy = self.minmax2(depth-1, not isMax, alpha, beta, startTime, timeLimit)
+                    if leafScores is not None:
+                        score = leafScores[i]
+                    else:
+                        self.mBoard.drawO(i)
+                        score, dummy = self.minmax2(depth-1, not isMax, alpha, beta, ply+1)
+                        self.mBoard.drawEmpty(i)
                     if score > alpha:
                         alpha = score
                         position = i
-                        self.mBestMove = i
 
-                    self.mBoard.drawEmpty(i)
                     if beta <= alpha:
+                        self.storeCutoff(i, depth, ply)
                         break
 
-            return alpha, position
+            result = alpha
         else:
             for i in moves:
-                self.mBoard.drawX(i)
-                score, dummy = self.minmax2(depth-1, not isMax, alpha, beta, startTime, timeLimit)
+                if leafScores is not None:
+                    score = leafScores[i]
+                else:
+                    self.mBoard.drawX(i)
+                    score, dummy = self.minmax2(depth-1, not isMax, alpha, beta, ply+1)
+                    self.mBoard.drawEmpty(i)
                 if score < beta:
                     beta = score
                     position = i
-                    self.mBestMove = i
-                self.mBoard.drawEmpty(i)
                 if alpha >= beta:
+                    self.storeCutoff(i, depth, ply)
                     break
 
-            return beta, position
+            result = beta
+
+        if result <= alphaOrig:
+            bound = Bound.upper
+        elif result >= betaOrig:
+            bound = Bound.lower
+        else:
+            bound = Bound.exact
+        bestMove = position if position is not None else tableMove
+        if bestMove is not None:
+            bestMove = self.mBoard.toCanonical(bestMove, symmetry)
+        self.mTable.store(key, depth, bound, result, bestMove)
+        return result, position
+
+    """this function gets the possible moves, the side which moves, the ply and the move
+        stored for the position and return the moves sorted from the most promising:
+        first the stored move (the principal variation move at the root),
+        than moves which win or block a line, than the killer moves of the ply
+        and than by the threats the move creates, the history table and the distance from the center"""
+    def orderMoves(self, moves, isMax, ply, tableMove):
+        board = self.mBoard
+        size = board.mSize
+        killers = self.mKillers[ply] if ply < len(self.mKillers) else ()
+        history = self.mHistory
+        center = self.mCenterBonus
+        cellLines = board.mCellLines
+        codes = board.mLineCodes
+        priorities = {}
+        for move in moves:
+            if move == tableMove:
+                priorities[move] = 1 << 60
+                continue
+            priority = history[move] + center[move]
+            if move in killers:
+                priority += 1 << 40
+            for index in cellLines[move]:
+                oSum, xSum = divmod(codes[index], size + 1)
+                own, other = (oSum, xSum) if isMax else (xSum, oSum)
+                if other == 0:
+                    if own == size - 1:
+                        priority += 1 << 50
+                    else:
+                        priority += 1 << (4 * own + 8)
+                elif own == 0:
+                    if other == size - 1:
+                        priority += 1 << 45
+                    else:
+                        priority += 1 << (4 * other + 6)
+            priorities[move] = priority
+        moves.sort(key=priorities.__getitem__, reverse=True)
+        return moves
+
+    """this function gets a move which caused a cutoff, the depth and the ply
+        and store it as a killer move of the ply and in the history table"""
+    def storeCutoff(self, move, depth, ply):
+        while len(self.mKillers) <= ply:
+            self.mKillers.append([])
+        killers = self.mKillers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        self.mHistory[move] += depth * depth
+
+    """this function gets the depth and search the root moves in parallel on the worker processes
+        like the young brothers wait concept: the first move (the principal variation move) is searched
+        here with a full window, than the workers test all the other moves at once with a null window
+        around its score (alpha, alpha + 1), which is cheap, and only a move which fails high (may be better)
+        is searched again with the window (alpha, infinity),
+        the best move is the first move (in orderMoves order) with the highest score - the same move the
+        serial search return, the workers get the deadline of mController and if one of them run out of time
+        SearchTimeout is raised like in the serial search"""
+    def parallelRootSearch(self, depth):
+        if self.mExecutor is None:
+            self.mExecutor = ProcessPoolExecutor(self.mWorkers)
+        board = self.mBoard
+        moves = self.orderMoves(self.genrateCandidates(True), True, 0, self.mPrincipalMove)
+        position = moves[0]
+        board.drawO(position)
+        alpha, dummy = self.minmax2(depth - 1, False, -self.mInfinity, self.mInfinity, 1)
+        board.drawEmpty(position)
+        remaining = self.mController.remaining()
+        deadline = None if remaining is None else time.time() + remaining
+        testAlpha = alpha
+        futures = [self.mExecutor.submit(searchRootMove, board.mSize, board.mXMask, board.mOMask,
+                                         move, depth, deadline, testAlpha, testAlpha + 1) for move in moves[1:]]
+        timePassed = False
+        for move, future in zip(moves[1:], futures):
+            score, nodes = future.result()
+            self.mNodes += nodes
+            if score is None:
+                timePassed = True
+            elif score > testAlpha and not timePassed:
+                # failed high, the move may be better than the best one so far, search it with the window
+                # of the best score now (a bound of the null window says nothing about a higher alpha)
+                score, nodes = self.mExecutor.submit(searchRootMove, board.mSize, board.mXMask, board.mOMask,
+                                                     move, depth, deadline, alpha, self.mInfinity).result()
+                self.mNodes += nodes
+                if score is None:
+                    timePassed = True
+                elif score > alpha:
+                    alpha = score
+                    position = move
+        if timePassed:
+            raise SearchTimeout()
+        return alpha, position
+
+    """this function print how many nodes the last search visited in every depth"""
+    def printSearchStats(self):
+        for stats in self.mSearchStats:
+            print('depth ' + str(stats['depth']) + ': ' + str(stats['nodes']) + ' nodes in '
+                  + str(round(stats['time'], 3)) + ' seconds' + ('' if stats['completed'] else ' (stopped)'))
+        print('used ' + str(round(self.mController.budgetUsed() * 100)) + '% of the search time')
+
+    """this function return the move of the opening book for the board or None if the board is not in the book"""
+    def getBookMove(self):
+        if self.mBook is None:
+            return None
+        key, symmetry = self.mBoard.getCanonicalHash()
+        move = self.mBook.lookup(key ^ self.mBoard.mZobristSide)
+        if move is None:
+            return None
+        move = self.mBoard.fromCanonical(move, symmetry)
+        if not self.mBoard.checkIfRubricEmpty(move):
+            return None
+        return move
 
     """this function search the best move it find in 5 seconds.
        The function goes as deep as possible in 5 second in the game tree
-       and return the best move"""
-    def iterativeDeepSearch(self):
-        startTime = datetime.datetime.now()
-        endTime = startTime + datetime.timedelta(0, SEARCH_TIME)
+       and return the best move of the deepest depth which was completed,
+       a depth which was stopped by the time limit is thrown away
+       optional timeLimit - the search time in seconds instead of SEARCH_TIME, None with maxDepth means no time limit
+       optional maxDepth - the deepest depth to search
+       optional useBook - if to take the move from the opening book
+       a move which wins or the only move which block the player is returned without searching"""
+    def iterativeDeepSearch(self, timeLimit=None, maxDepth=None, useBook=True):
+        self.mSearchStats = []
+        self.mSearchTime = 0
+        self.mSearchSource = 'book'
+        bookMove = self.getBookMove() if useBook else None
+        if bookMove is not None:
+            return bookMove
+        self.mSearchSource = 'forced'
+        forcedMove = self.getForcedMove()
+        if forcedMove is not None:
+            return forcedMove
+        self.mSearchSource = 'search'
+        if timeLimit is None and maxDepth is None:
+            timeLimit = SEARCH_TIME
+        controller = self.mController
+        controller.start(timeLimit)
+        board = self.mBoard
+        xMask, oMask, lastMove = board.mXMask, board.mOMask, board.lastMove
+        emptyRubrics = len(self.genrate())
+        if len(self.genrateCandidates(True)) == 1:
+            # only one move is worth playing, search it to depth 1 so the result is still a searched move
+            emptyRubrics = 1
         depth = 1
-        position = None
-        self.mTimePassed = False
-        while True:
-            currentTime = datetime.datetime.now()
-            if currentTime >= endTime:
+        bestPosition = None
+        self.mPrincipalMove = None
+        self.mKillers = []
+        self.mHistory = [value // 2 for value in self.mHistory]
+        while depth <= emptyRubrics and (maxDepth is None or depth <= maxDepth) and not controller.expired():
+            self.mNodes = 0
+            depthStart = controller.elapsed()
+            try:
+                if self.mWorkers > 1:
+                    best, position = self.parallelRootSearch(depth)
+                else:
+                    best, position = self.minmax2(depth, True, -self.mInfinity, self.mInfinity)
+            except SearchTimeout:
+                board.setPosition(xMask, oMask, lastMove)
+                self.mSearchStats.append({'depth': depth, 'nodes': self.mNodes,
+                                          'time': controller.elapsed() - depthStart, 'completed': False})
                 break
-            best, position = self.minmax2(depth, True, -10000000, 10000000, currentTime, endTime-currentTime)
+            self.mSearchStats.append({'depth': depth, 'nodes': self.mNodes,
+                                      'time': controller.elapsed() - depthStart, 'completed': True})
+            if position is not None:
+                bestPosition = position
+                self.mPrincipalMove = position
             depth += 1
 
-        if position is None:
-            position = self.mBestMove
-
-        return position
+        self.mSearchTime = controller.elapsed()
+        if bestPosition is None:
+            # not even the first depth was completed, take the most promising move
+            moves = self.orderMoves(self.genrate(), True, 0, None)
+            bestPosition = moves[0] if moves else None
+        self.mBestMove = bestPosition
+        return bestPosition
+
+    """this function gets a position and draw it for the side which has the turn,
+        'X' for the player and 'O' for the computer, and return the game state after the move,
+        it lets the game be played without input and print"""
+    def makeMove(self, position):
+        if not (0 <= position <= (self.mBoardSize ** 2 - 1)):
+            raise OutOfRange("Wrong position, please choose position 0 - " + str(self.mBoardSize ** 2 - 1))
+        if not self.mBoard.checkIfRubricEmpty(position):
+            raise NoneEmptyPosition("this rubric taken please choose other rubric")
+        if self.mTurn % 2 == 0:
+            self.mBoard.drawX(position)
+        else:
+            self.mBoard.drawO(position)
+        self.mTurn = (self.mTurn + 1) % 2
+        return self.checkGameState()
+
+    """this function return the best computer move for the board without drawing it,
+        it gets optional timeLimit in seconds and optional maxDepth like iterativeDeepSearch"""
+    def getBestMove(self, timeLimit=None, maxDepth=None, useBook=True):
+        return self.iterativeDeepSearch(timeLimit, maxDepth, useBook)
+
+    """this function return the statistics of the last search:
+        depth - the deepest completed depth, nodes - the visited nodes, time - the search time in seconds,
+        timeLimit and budgetUsed - the part of the time limit which was used,
+        nodesPerSecond, source - 'search', 'book' if the move was taken from the opening book
+        or 'forced' if it was a winning or the only blocking move, book - if the source is the book,
+        and depths - the stats of every depth"""
+    def getSearchStats(self):
+        nodes = sum(stats['nodes'] for stats in self.mSearchStats)
+        completed = [stats['depth'] for stats in self.mSearchStats if stats['completed']]
+        return {'depth': completed[-1] if completed else 0,
+                'nodes': nodes,
+                'time': self.mSearchTime,
+                'timeLimit': self.mController.mTimeLimit,
+                'budgetUsed': self.mController.budgetUsed() if self.mSearchStats else 0,
+                'nodesPerSecond': nodes / self.mSearchTime if self.mSearchTime > 0 else 0,
+                'source': self.mSearchSource,
+                'book': self.mSearchSource == 'book',
+                'depths': list(self.mSearchStats)}
 
     """this function gets a board line and calculate how many
         'X', 'O' and empty rubrics"""
@@ -382,8 +1075,12 @@ class Game:
 
     """this function gets a board line and calculate it score"""
     def getScoreLine(self, line):
-        score = 0
         oSum, xSum, EmptySum = self.calculateLine(line)
+        return self.getScoreCounts(oSum, xSum)
+
+    """this function gets the number of 'O' and 'X' in a line and calculate the line score"""
+    def getScoreCounts(self, oSum, xSum):
+        score = 0
         if xSum == 0 and oSum != 0:
             if oSum == self.mBoard.mSize:
                 score += 11 ** (oSum - 1)
@@ -392,22 +1089,37 @@ class Game:
             score += -(10 ** (xSum - 1))
         return score
 
-    """this function evaluate the game board and return the score"""
+    """this function evaluate the game board and return the score,
+        the board keeps the score of every line up to date on every draw
+        so the evaluation only reads the running score"""
     def evaluate(self):
-        score = 0
-        for i in range(self.mBoard.mSize):
-            score += self.getScoreLine(self.mBoard.getRow(i))
-            score += self.getScoreLine(self.mBoard.getColumn(i))
-
-        diagonals = self.mBoard.getDiagonal()
-        for i in range(2):
-            score += self.getScoreLine(diagonals[i])
-        return score
-
-
-game = Game(NUMBER_OF_PLAYERS, BOARD_SIZE)
-game.start()
-
-
-
-
+        return self.mBoard.mScore
+
+"""the games of the worker processes of the parallel search, one for every board size,
+    they are kept between the searches so the transposition table of every worker is reused"""
+workerGames = {}
+
+
+"""this function run on a worker process of the parallel search, it gets the board size,
+    the masks of 'X' and 'O', the root move of the computer, the depth, the deadline (time.time() or None)
+    and the alpha beta window and return the score of the move (a bound if it is out of the window),
+    None if the deadline passed, and the number of visited nodes"""
+def searchRootMove(size, xMask, oMask, move, depth, deadline, alpha, beta):
+    if size not in workerGames:
+        workerGames[size] = Game(1, size, 1)
+    game = workerGames[size]
+    game.mBoard.setPosition(xMask, oMask, None)
+    game.mBoard.drawO(move)
+    game.mController.start(None if deadline is None else deadline - time.time())
+    game.mNodes = 0
+    try:
+        game.mController.check()
+        score, dummy = game.minmax2(depth - 1, False, alpha, beta, 1)
+    except SearchTimeout:
+        score = None
+    return score, game.mNodes
+
+
+if __name__ == '__main__':
+    game = Game(NUMBER_OF_PLAYERS, BOARD_SIZE)
+    game.start()
@@ -0,0 +1,44 @@
+"""
+The parts every benchmark script of the repo shares: the percentile of the measures, the --seed and --output
+arguments and the JSON report (with the git commit and the date) so runs can be compared between commits
+"""
+import json
+import os
+import subprocess
+import time
+
+
+"""The percentile of the values (the nearest rank), 0 if there are none."""
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+"""The current git commit, None if it is not known."""
+def getCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+"""Add the --seed and --output arguments to the argparse parser."""
+def addReportArguments(parser):
+    parser.add_argument('--seed', type=int, default=0, help='the random seed')
+    parser.add_argument('--output', default=None, help='the JSON report file')
+
+
+"""The report of a run with the parsed arguments, the script adds its results to it."""
+def newReport(args):
+    return {'commit': getCommit(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'arguments': vars(args)}
+
+
+"""Write the report as JSON to the path, nothing if the path is None."""
+def writeReport(report, path):
+    if path:
+        with open(path, 'w') as reportFile:
+            json.dump(report, reportFile, indent=2)
@@ -0,0 +1,167 @@
+import csv
+import itertools
+import json
+import os
+import time
+
+from contact_store import packNumber, DEFAULT_COUNTRY
+
+CHUNK_SIZE = 10000
+FORMATS = {'.csv': 'csv', '.vcf': 'vcard', '.vcard': 'vcard', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+NAME_COLUMNS = ('name', 'fn', 'full name', 'contact')
+NUMBER_COLUMNS = ('number', 'phone', 'telephone', 'tel', 'mobile')
+
+
+def detectFormat(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError('unknown contacts file type ' + extension + ', use ' + ', '.join(sorted(FORMATS)))
+    return FORMATS[extension]
+
+
+"""Yield (name, number) rows, a header row with name and number columns is used if there is one,
+otherwise the first two columns are the name and the number."""
+def readCsv(contactsFile):
+    reader = csv.reader(contactsFile)
+    nameColumn, numberColumn = 0, 1
+    for row in reader:
+        header = [column.strip().lower() for column in row]
+        names = [index for index, column in enumerate(header) if column in NAME_COLUMNS]
+        numbers = [index for index, column in enumerate(header) if column in NUMBER_COLUMNS]
+        if names and numbers:
+            nameColumn, numberColumn = names[0], numbers[0]
+        elif len(row) > max(nameColumn, numberColumn):
+            yield row[nameColumn], row[numberColumn]
+        break
+    for row in reader:
+        if len(row) > max(nameColumn, numberColumn):
+            yield row[nameColumn], row[numberColumn]
+
+
+"""Yield the name (FN) and the first number (TEL) of every card."""
+def readVcard(contactsFile):
+    name = number = None
+    for line in unfoldVcard(contactsFile):
+        key, _, value = line.partition(':')
+        field = key.split(';')[0].upper()
+        if field == 'BEGIN':
+            name = number = None
+        elif field == 'FN':
+            name = value.strip()
+        elif field == 'TEL' and number is None:
+            number = value.strip()
+        elif field == 'END' and name is not None and number is not None:
+            yield name, number
+
+
+"""Join the folded lines of a vCard file (a line starting with a space continues the previous one)."""
+def unfoldVcard(contactsFile):
+    current = None
+    for line in contactsFile:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def readJsonl(contactsFile):
+    for line in contactsFile:
+        line = line.strip()
+        if line:
+            record = json.loads(line)
+            yield record.get('name'), record.get('number')
+
+
+READERS = {'csv': readCsv, 'vcard': readVcard, 'jsonl': readJsonl}
+
+
+def writeCsv(contactsFile, contacts):
+    writer = csv.writer(contactsFile)
+    writer.writerow(['name', 'number'])
+    for name, number in contacts:
+        writer.writerow([name, number])
+        yield
+
+
+def writeVcard(contactsFile, contacts):
+    for name, number in contacts:
+        contactsFile.write('BEGIN:VCARD\r\nVERSION:3.0\r\nFN:%s\r\nTEL:%s\r\nEND:VCARD\r\n' % (name, number))
+        yield
+
+
+def writeJsonl(contactsFile, contacts):
+    for name, number in contacts:
+        contactsFile.write(json.dumps({'name': name, 'number': number}) + '\n')
+        yield
+
+
+WRITERS = {'csv': writeCsv, 'vcard': writeVcard, 'jsonl': writeJsonl}
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+"""Stream the contacts of a CSV, vCard or JSON Lines file into the store chunk by chunk,
+every chunk is one transaction. Numbers are normalized to E.164 (national numbers get the country code)
+and packed once here, the store gets the packed numbers,
+rows without a name or a valid number are counted as invalid and names already in the store as duplicates (kept unless replace).
+progress, if given, is called with the report after every chunk. Return the report dict."""
+def importContacts(path, store, fileFormat=None, chunkSize=CHUNK_SIZE, replace=False, progress=None,
+                   country=DEFAULT_COUNTRY):
+    fileFormat = fileFormat or detectFormat(path)
+    report = {'read': 0, 'added': 0, 'duplicates': 0, 'invalid': 0, 'seconds': 0.0, 'rowsPerSecond': 0.0}
+    start = time.perf_counter()
+    with open(path, newline='', encoding='utf-8') as contactsFile:
+        for chunk in chunks(READERS[fileFormat](contactsFile), chunkSize):
+            valid = []
+            for name, number in chunk:
+                name = (name or '').strip()
+                try:
+                    number = packNumber(number, country) if number is not None else None
+                except ValueError:
+                    number = None
+                if not name or number is None:
+                    report['invalid'] += 1
+                else:
+                    valid.append((name, number))
+            added, duplicates = store.addMany(valid, replace, packed=True)
+            report['read'] += len(chunk)
+            report['added'] += added
+            report['duplicates'] += duplicates
+            updateThroughput(report, start)
+            if progress is not None:
+                progress(report)
+    updateThroughput(report, start)
+    return report
+
+
+"""Stream all the contacts of the store to a CSV, vCard or JSON Lines file in name order,
+the directory is never held in memory. Return the report dict."""
+def exportContacts(path, store, fileFormat=None, progress=None, progressEvery=CHUNK_SIZE):
+    fileFormat = fileFormat or detectFormat(path)
+    report = {'written': 0, 'seconds': 0.0, 'rowsPerSecond': 0.0}
+    start = time.perf_counter()
+    with open(path, 'w', newline='', encoding='utf-8') as contactsFile:
+        for _ in WRITERS[fileFormat](contactsFile, store.iterContacts()):
+            report['written'] += 1
+            if progress is not None and report['written'] % progressEvery == 0:
+                updateThroughput(report, start, 'written')
+                progress(report)
+    updateThroughput(report, start, 'written')
+    return report
+
+
+def updateThroughput(report, start, rows='read'):
+    report['seconds'] = time.perf_counter() - start
+    report['rowsPerSecond'] = report[rows] / report['seconds'] if report['seconds'] > 0 else 0.0
@@ -0,0 +1,200 @@
+"""
+Change journal and snapshots of the telephone directory
+every change is appended to the journal (a JSON Lines file) once the SQLite directory committed it,
+the directory saves the journal offset its record will end at in the same transaction (a change the directory
+rejects is never journaled), so on startup only the journal tail after that offset is replayed
+a snapshot is a compacted copy of the directory (VACUUM INTO), it keeps the journal offset it was taken at,
+if the directory file is lost the latest snapshot is restored and the journal after it is replayed
+the journal is never rewritten, it is the history of every contact: the first history call reads it once
+into an index of the records of every name, the appends after it keep the index up to date
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from contact_store import unpackNumber
+
+SNAPSHOT_EVERY = 10000
+KEEP_SNAPSHOTS = 2
+READ_BLOCK = 4096
+
+
+"""The journal file of the directory file."""
+def journalPath(path):
+    return os.path.splitext(path)[0] + '.journal'
+
+
+"""The directory which keeps the snapshots of the directory file."""
+def snapshotDirectory(path):
+    return os.path.splitext(path)[0] + '-snapshots'
+
+
+"""Append only journal of the directory changes, one JSON record per line.
+A record is one transaction: {"seq": ..., "time": ..., "changes": [[op, name, number], ...]}
+or an imported chunk: {"seq": ..., "time": ..., "import": [[name, number], ...], "replace": ..., "packed": ...}
+(with "packed": true the numbers are packNumber integers).
+sync=True fsyncs every append, otherwise appends are flushed to the OS like the directory
+(synchronous=NORMAL)."""
+class ChangeJournal:
+
+    def __init__(self, path, sync=False):
+        self.path = path
+        self.sync = sync
+        self.seq, self.offset = self.recover()
+        self.file = open(path, 'ab')
+        # name -> the offsets of the records which change it, built by the first history call
+        self.names = None
+        self.namesLock = threading.Lock()
+
+    """Return the seq of the last record and the offset after it, reading only the end of the file.
+    A last line torn by a crash (without its new line) is cut off."""
+    def recover(self):
+        if not os.path.exists(self.path):
+            return 0, 0
+        with open(self.path, 'r+b') as journalFile:
+            end = journalFile.seek(0, os.SEEK_END)
+            complete = self.lineStart(journalFile, end)
+            if complete < end:
+                journalFile.truncate(complete)
+            if complete == 0:
+                return 0, 0
+            start = self.lineStart(journalFile, complete - 1)
+            journalFile.seek(start)
+            return json.loads(journalFile.read(complete - start))['seq'], complete
+
+    """The offset after the last new line before end (0 if there is none), read backwards in blocks."""
+    @staticmethod
+    def lineStart(journalFile, end):
+        position = end
+        while position > 0:
+            step = min(READ_BLOCK, position)
+            position -= step
+            journalFile.seek(position)
+            index = journalFile.read(step).rfind(b'\n')
+            if index >= 0:
+                return position + index + 1
+        return 0
+
+    """Append the record with the next seq and the time, return the seq and the offset after it."""
+    def append(self, record):
+        return self.write(record, self.encode(record)[0])
+
+    """Encode the record with the next seq and the time, return the data and the seq and the offset after it
+    the record gets if write(record, data) is the next write. Nothing is written."""
+    def encode(self, record):
+        seq = self.seq + 1
+        data = (json.dumps(dict(record, seq=seq, time=round(time.time(), 3)), separators=(',', ':'))
+                + '\n').encode('utf-8')
+        return data, seq, self.offset + len(data)
+
+    """Write the record encoded by encode, return the seq and the offset after it."""
+    def write(self, record, data):
+        self.seq += 1
+        self.file.write(data)
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        with self.namesLock:
+            if self.names is not None:
+                self.indexRecord(record, self.offset)
+            self.offset += len(data)
+        return self.seq, self.offset
+
+    """Yield every record from the offset with the offset after it."""
+    def read(self, offset=0):
+        with open(self.path, 'rb') as journalFile:
+            journalFile.seek(offset)
+            while offset < self.offset:
+                line = journalFile.readline()
+                offset += len(line)
+                yield json.loads(line), offset
+
+    """The names the record changes."""
+    @staticmethod
+    def recordNames(record):
+        return ({changed for operation, changed, number in record.get('changes', [])}
+                | {changed for changed, number in record.get('import', [])})
+
+    """Add the record which starts at the offset to the index, the caller holds namesLock."""
+    def indexRecord(self, record, offset):
+        for name in self.recordNames(record):
+            self.names.setdefault(name, []).append(offset)
+
+    """The offsets of the records which change the name, the whole journal is read on the first call."""
+    def recordOffsets(self, name):
+        with self.namesLock:
+            if self.names is None:
+                self.names = {}
+                start = 0
+                for record, offset in self.read():
+                    self.indexRecord(record, start)
+                    start = offset
+            return list(self.names.get(name, ()))
+
+    """Yield (seq, time, op, number) of every change of the name, only its records are read."""
+    def history(self, name):
+        offsets = self.recordOffsets(name)
+        if not offsets:
+            return
+        with open(self.path, 'rb') as journalFile:
+            for offset in offsets:
+                journalFile.seek(offset)
+                yield from self.recordHistory(json.loads(journalFile.readline()), name)
+
+    """Yield (seq, time, op, number) of the changes of the name in the record."""
+    @staticmethod
+    def recordHistory(record, name):
+        for operation, changed, number in record.get('changes', []):
+            if changed == name:
+                yield record['seq'], record['time'], operation, number
+        for changed, number in record.get('import', []):
+            if changed == name:
+                yield record['seq'], record['time'], 'import', unpackNumber(number) if record.get('packed') else number
+
+    def close(self):
+        self.file.close()
+
+
+"""Write a compacted copy of the SQLite directory file to the snapshots directory, named by the journal seq
+it has, and delete all but the newest keep snapshots. It only reads the directory, so in WAL mode
+it runs next to the writers. Return the snapshot path."""
+def takeSnapshot(path, directory, keep=KEEP_SNAPSHOTS):
+    os.makedirs(directory, exist_ok=True)
+    temporary = os.path.join(directory, 'snapshot.tmp')
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute('VACUUM INTO ?', (temporary,))
+    finally:
+        connection.close()
+    connection = sqlite3.connect(temporary)
+    try:
+        row = connection.execute("SELECT value FROM meta WHERE key = 'journal_seq'").fetchone()
+    finally:
+        connection.close()
+    snapshot = os.path.join(directory, 'contacts-%012d.db' % (row[0] if row else 0))
+    os.replace(temporary, snapshot)
+    for old in listSnapshots(directory)[:-keep]:
+        os.remove(old)
+    return snapshot
+
+
+"""The snapshot files, the oldest first."""
+def listSnapshots(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith('contacts-') and name.endswith('.db'))
+
+
+"""Copy the latest snapshot to the directory file, return the snapshot or None if there is none."""
+def restoreSnapshot(path, directory):
+    snapshots = listSnapshots(directory)
+    if not snapshots:
+        return None
+    shutil.copyfile(snapshots[-1], path)
+    return snapshots[-1]
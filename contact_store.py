@@ -0,0 +1,450 @@
+import abc
+import difflib
+import os
+import sqlite3
+
+DIRECTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'contacts.db')
+SEARCH_LIMIT = 20
+PAGE_SIZE = 20
+FUZZY_CUTOFF = 0.6
+DEFAULT_COUNTRY = '91'
+NATIONAL_DIGITS = 10
+MIN_DIGITS = 8
+NUMBER_DIGITS = 15
+
+
+"""The number in E.164 form ('+', the country code and the national digits), None if it is not a phone number.
+Spaces and separators are dropped, a 00 prefix is read like +, a trunk 0 is replaced by the country code
+and a number of up to NATIONAL_DIGITS digits without a prefix gets the country code."""
+def normalizeNumber(number, country=DEFAULT_COUNTRY):
+    number = str(number).strip()
+    plus = number.startswith('+')
+    digits = ''.join(ch for ch in number if ch not in ' -.()/+')
+    if not digits or digits.strip('0123456789') or number.count('+') > int(plus):
+        return None
+    if not plus:
+        if digits.startswith('00'):
+            digits = digits[2:]
+        elif digits.startswith('0'):
+            digits = country + digits[1:]
+        elif len(digits) <= NATIONAL_DIGITS:
+            digits = country + digits
+    if digits.startswith('0') or not MIN_DIGITS <= len(digits) <= NUMBER_DIGITS:
+        return None
+    return '+' + digits
+
+
+"""The E.164 digits of the number as one integer (they never start with 0 and fit in 64 bits),
+raise ValueError if it is not a phone number."""
+def packNumber(number, country=DEFAULT_COUNTRY):
+    normalized = normalizeNumber(number, country)
+    if normalized is None:
+        raise ValueError('not a phone number: ' + str(number))
+    return int(normalized[1:])
+
+
+def unpackNumber(packed):
+    return '+' + str(packed)
+
+
+"""The digits of the packed number from the last one, padded to NUMBER_DIGITS digits, as an integer.
+All the keys have the same width, so the numbers ending with the same digits are one range of keys."""
+def reversedKey(packed):
+    return int(str(packed)[::-1].ljust(NUMBER_DIGITS, '0'))
+
+
+"""The smallest and the biggest reversedKey of the numbers which end with the digits."""
+def suffixRange(digits):
+    key = reversedDigits(digits)
+    return int(key.ljust(NUMBER_DIGITS, '0')), int(key.ljust(NUMBER_DIGITS, '9'))
+
+
+"""The form of the name used by the prefix and fuzzy indexes."""
+def nameKey(name):
+    return name.casefold()
+
+
+"""The name key padded so the start and the end of the name are trigrams too."""
+def paddedKey(name):
+    return '  ' + nameKey(name) + ' '
+
+
+"""The trigrams of the name."""
+def nameGrams(name):
+    padded = paddedKey(name)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+"""The digits of the number from the last one, a number suffix is a prefix of it."""
+def reversedDigits(number):
+    return ''.join(ch for ch in reversed(str(number)) if ch.isdigit())
+
+
+"""The smallest string bigger than all the strings starting with the prefix."""
+def prefixEnd(prefix):
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+"""Create the fuzzy name index: name_trigrams, an FTS5 table with the trigram tokenizer over the padded name keys
+(by the rowid of the contact), or without FTS5 or its trigram tokenizer (before SQLite 3.34) the name_grams table
+of the trigrams of every name. FTS5 writes the trigrams of a whole chunk of contacts together,
+it indexes a bulk import several times faster than one name_grams row per trigram."""
+def createNameIndex(connection):
+    try:
+        connection.execute("CREATE VIRTUAL TABLE name_trigrams USING fts5(key, tokenize='trigram', content='', "
+                           "detail='none')")
+    except sqlite3.OperationalError:
+        # the grams of a name are known, deletes find them by the primary key, a second index on the name
+        # would make bulk imports write twice the gram index pages
+        connection.execute('CREATE TABLE name_grams (gram TEXT NOT NULL, name TEXT NOT NULL, '
+                           'PRIMARY KEY (gram, name)) WITHOUT ROWID')
+
+
+# every entry is one schema version, PRAGMA user_version keeps how many were applied,
+# a step is an SQL statement or a function which gets the connection
+MIGRATIONS = [
+    # numbers are packed E.164 digits, number_reversed is their fixed width reverse key (see reversedKey),
+    # meta keeps values saved with the changes, like the journal offset of the last change (see contact_journal.py)
+    ['CREATE TABLE contacts (name TEXT PRIMARY KEY, number INTEGER NOT NULL, name_key TEXT, '
+     'number_reversed INTEGER NOT NULL)',
+     'CREATE INDEX contacts_number ON contacts (number)',
+     'CREATE INDEX contacts_name_key ON contacts (name_key)',
+     'CREATE INDEX contacts_number_reversed ON contacts (number_reversed)',
+     createNameIndex,
+     'CREATE TABLE meta (key TEXT PRIMARY KEY, value)'],
+]
+
+
+"""Interface of the storage backends of the telephone directory, contacts are (name, number) pairs keyed
+by name. Numbers are given in any form normalizeNumber reads and returned in E.164 form,
+writing a number which is not a phone number raises ValueError."""
+class ContactStore(abc.ABC):
+
+    """Store the contact, a contact with the same name is replaced."""
+    @abc.abstractmethod
+    def add(self, name, number):
+        pass
+
+    """Return the number of the name or None."""
+    @abc.abstractmethod
+    def get(self, name):
+        pass
+
+    """Set the number of the name, return True if the name existed."""
+    @abc.abstractmethod
+    def update(self, name, number):
+        pass
+
+    """Store a batch of (name, number) pairs together, names which already exist are kept
+    unless replace is True, return the number of new contacts and the number of duplicates.
+    meta is a dict of values saved together with the batch (see getMeta), unless the batch writes no contact.
+    With packed=True the numbers are packNumber integers already and are not read again."""
+    @abc.abstractmethod
+    def addMany(self, contacts, replace=False, meta=None, packed=False):
+        pass
+
+    """Remove the contact, return True if the name existed."""
+    @abc.abstractmethod
+    def delete(self, name):
+        pass
+
+    """Apply ('add' | 'update' | 'delete', name, number) operations in order (number is ignored by delete),
+    add and update store the contact, return for every operation True if the name existed before it.
+    meta is a dict of values saved together with the operations (see getMeta), unless there are none."""
+    @abc.abstractmethod
+    def applyBatch(self, operations, meta=None):
+        pass
+
+    """Return a value saved with setMeta or with a batch."""
+    @abc.abstractmethod
+    def getMeta(self, key, default=None):
+        pass
+
+    """Save the values of the dict meta."""
+    @abc.abstractmethod
+    def setMeta(self, meta):
+        pass
+
+    """Yield all the (name, number) pairs sorted by name."""
+    @abc.abstractmethod
+    def iterContacts(self):
+        pass
+
+    """Return the number of contacts."""
+    @abc.abstractmethod
+    def count(self):
+        pass
+
+    """Return up to size contacts sorted by name which come after the name after (from the first one
+    if it is None), the name of the last contact is the cursor of the next page."""
+    @abc.abstractmethod
+    def page(self, after=None, size=PAGE_SIZE):
+        pass
+
+    """Yield the pages of the directory one by one, every page is fetched only when it is needed."""
+    def iterPages(self, size=PAGE_SIZE, after=None):
+        while True:
+            page = self.page(after, size)
+            if page:
+                yield page
+            if len(page) < size:
+                return
+            after = page[-1][0]
+
+    """Yield up to limit contacts whose name starts with the prefix (ignoring case), sorted by name."""
+    @abc.abstractmethod
+    def searchPrefix(self, prefix, limit=SEARCH_LIMIT):
+        pass
+
+    """Yield up to limit contacts whose name is similar to the text, the most similar first."""
+    @abc.abstractmethod
+    def searchFuzzy(self, text, limit=SEARCH_LIMIT):
+        pass
+
+    """Yield up to limit contacts whose number ends with the digits (a full number matches too)."""
+    @abc.abstractmethod
+    def searchNumber(self, digits, limit=SEARCH_LIMIT):
+        pass
+
+    """Return the names saved with the number (in any form), sorted."""
+    @abc.abstractmethod
+    def namesOfNumber(self, number):
+        pass
+
+    """Return up to limit (number, names) pairs of numbers saved under more than one name, sorted by number."""
+    @abc.abstractmethod
+    def findDuplicates(self, limit=SEARCH_LIMIT):
+        pass
+
+    """Release the storage."""
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+
+"""Contacts in an SQLite file (WAL mode) with indexes on the name and the number,
+nothing is loaded to memory when the directory is opened.
+Searches use the indexes: the name primary key for exact names, name_key for prefixes,
+the trigram index (see createNameIndex) for fuzzy names and number_reversed for number suffixes.
+Numbers are stored packed, the E.164 digits as an INTEGER (8 bytes at most instead of a string)
+and number_reversed is the fixed width integer reversedKey of the number."""
+class SQLiteContactStore(ContactStore):
+
+    def __init__(self, path=DIRECTORY_FILE):
+        self.path = path
+        # a store is used by one thread at a time, but it may be closed by another one (see DirectoryService)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        # 64 MB of page cache keeps the index pages of an import in memory
+        self.connection.execute('PRAGMA cache_size=-65536')
+        self.migrate()
+        self.trigrams = self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'name_trigrams'").fetchone() \
+            is not None
+
+    def migrate(self):
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        for number in range(version, len(MIGRATIONS)):
+            with self.connection:
+                for step in MIGRATIONS[number]:
+                    if callable(step):
+                        step(self.connection)
+                    else:
+                        self.connection.execute(step)
+                self.connection.execute('PRAGMA user_version = %d' % (number + 1))
+
+    def add(self, name, number):
+        with self.connection:
+            self.write(name, number)
+
+    """Insert or replace the contact and its index rows, the caller holds the transaction."""
+    def write(self, name, number):
+        packed = packNumber(number)
+        # an existing contact keeps its rowid, the name index points at it
+        if self.connection.execute('UPDATE contacts SET number = ?, number_reversed = ? WHERE name = ?',
+                                   (packed, reversedKey(packed), name)).rowcount:
+            return True
+        last = self.lastRowid()
+        self.connection.execute('INSERT INTO contacts (name, number, name_key, number_reversed) VALUES (?, ?, ?, ?)',
+                                (name, packed, nameKey(name), reversedKey(packed)))
+        self.indexNames(last)
+        return False
+
+    def lastRowid(self):
+        return self.connection.execute('SELECT COALESCE(MAX(rowid), 0) FROM contacts').fetchone()[0]
+
+    """Add the names of the contacts inserted after the rowid last to the fuzzy name index (new rows get
+    rowids above the biggest one), the caller holds the transaction."""
+    def indexNames(self, last):
+        if self.trigrams:
+            self.connection.execute("INSERT INTO name_trigrams (rowid, key) SELECT rowid, '  ' || name_key || ' ' "
+                                    'FROM contacts WHERE rowid > ?', (last,))
+        else:
+            names = [row[0] for row in self.connection.execute('SELECT name FROM contacts WHERE rowid > ?', (last,))]
+            self.connection.executemany('INSERT INTO name_grams (gram, name) VALUES (?, ?)',
+                                        [(gram, name) for name in names for gram in nameGrams(name)])
+
+    def addMany(self, contacts, replace=False, meta=None, packed=False):
+        batch = {}
+        duplicates = 0
+        for name, number in contacts:
+            if name in batch:
+                duplicates += 1
+                if not replace:
+                    continue
+            batch[name] = number if packed else packNumber(number)
+        names = list(batch)
+        existing = set()
+        # SQLite limits the number of parameters of one statement
+        for start in range(0, len(names), 900):
+            part = names[start:start + 900]
+            existing.update(row[0] for row in self.connection.execute(
+                'SELECT name FROM contacts WHERE name IN (%s)' % ','.join('?' * len(part)), part))
+        duplicates += len(existing)
+        new = [(name, batch[name]) for name in names if name not in existing]
+        with self.connection:
+            last = self.lastRowid()
+            self.connection.executemany('INSERT INTO contacts (name, number, name_key, number_reversed) '
+                                        'VALUES (?, ?, ?, ?)',
+                                        [(name, number, nameKey(name), reversedKey(number)) for name, number in new])
+            # the names of the whole chunk are indexed by one statement
+            self.indexNames(last)
+            if replace:
+                self.connection.executemany('UPDATE contacts SET number = ?, number_reversed = ? WHERE name = ?',
+                                            [(batch[name], reversedKey(batch[name]), name) for name in existing])
+            if new or (replace and existing):
+                self.writeMeta(meta)
+        return len(new), duplicates
+
+    def get(self, name):
+        row = self.connection.execute('SELECT number FROM contacts WHERE name = ?', (name,)).fetchone()
+        return unpackNumber(row[0]) if row else None
+
+    def update(self, name, number):
+        with self.connection:
+            return self.write(name, number)
+
+    def delete(self, name):
+        with self.connection:
+            return self.remove(name)
+
+    """Delete the contact and its index rows, the caller holds the transaction."""
+    def remove(self, name):
+        row = self.connection.execute('SELECT rowid FROM contacts WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return False
+        if self.trigrams:
+            # the index keeps no copy of the keys, a delete gives it the key the row was indexed with
+            self.connection.execute("INSERT INTO name_trigrams (name_trigrams, rowid, key) VALUES ('delete', ?, ?)",
+                                    (row[0], paddedKey(name)))
+        else:
+            grams = sorted(nameGrams(name))
+            self.connection.execute('DELETE FROM name_grams WHERE name = ? AND gram IN (%s)'
+                                    % ','.join('?' * len(grams)), [name] + grams)
+        self.connection.execute('DELETE FROM contacts WHERE rowid = ?', (row[0],))
+        return True
+
+    def applyBatch(self, operations, meta=None):
+        # the whole batch is one transaction, it is written all together or not at all
+        # (a number which is not a phone number rolls it back)
+        with self.connection:
+            results = [self.remove(name) if operation == 'delete' else self.write(name, number)
+                       for operation, name, number in operations]
+            if results:
+                self.writeMeta(meta)
+        return results
+
+    def getMeta(self, key, default=None):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def setMeta(self, meta):
+        with self.connection:
+            self.writeMeta(meta)
+
+    """Save the meta values, the caller holds the transaction."""
+    def writeMeta(self, meta):
+        if meta:
+            self.connection.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', meta.items())
+
+    def iterContacts(self):
+        for name, number in self.connection.execute('SELECT name, number FROM contacts ORDER BY name'):
+            yield name, unpackNumber(number)
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM contacts').fetchone()[0]
+
+    def page(self, after=None, size=PAGE_SIZE):
+        # keyset pagination on the name primary key, every page is one index range however deep it is
+        if after is None:
+            rows = self.connection.execute('SELECT name, number FROM contacts ORDER BY name LIMIT ?', (size,))
+        else:
+            rows = self.connection.execute('SELECT name, number FROM contacts WHERE name > ? ORDER BY name LIMIT ?',
+                                           (after, size))
+        return [(name, unpackNumber(number)) for name, number in rows]
+
+    def searchPrefix(self, prefix, limit=SEARCH_LIMIT):
+        key = nameKey(prefix)
+        if not key:
+            rows = self.connection.execute('SELECT name, number FROM contacts ORDER BY name_key LIMIT ?', (limit,))
+        else:
+            rows = self.connection.execute('SELECT name, number FROM contacts WHERE name_key >= ? AND name_key < ? '
+                                           'ORDER BY name_key LIMIT ?', (key, prefixEnd(key), limit))
+        for name, number in rows:
+            yield name, unpackNumber(number)
+
+    def searchFuzzy(self, text, limit=SEARCH_LIMIT):
+        # the names sharing the most trigrams with the text are the candidates,
+        # only they are compared with the text
+        grams = sorted(nameGrams(text))
+        key = nameKey(text)
+        if self.trigrams:
+            # one match per trigram, the FTS5 rank would prefer short names over names sharing more trigrams
+            candidates = self.connection.execute(
+                'SELECT c.name, c.number FROM (SELECT rowid FROM (%s) GROUP BY rowid ORDER BY COUNT(*) DESC LIMIT ?) t '
+                'JOIN contacts c ON c.rowid = t.rowid'
+                % ' UNION ALL '.join(['SELECT rowid FROM name_trigrams WHERE name_trigrams MATCH ?'] * len(grams)),
+                ['"' + gram.replace('"', '""') + '"' for gram in grams] + [limit * 10]).fetchall()
+        else:
+            candidates = self.connection.execute(
+                'SELECT c.name, c.number FROM (SELECT name FROM name_grams WHERE gram IN (%s) '
+                'GROUP BY name ORDER BY COUNT(*) DESC LIMIT ?) g JOIN contacts c ON c.name = g.name'
+                % ','.join('?' * len(grams)), grams + [limit * 10]).fetchall()
+        scored = []
+        for name, number in candidates:
+            ratio = difflib.SequenceMatcher(None, key, nameKey(name)).ratio()
+            if ratio >= FUZZY_CUTOFF:
+                scored.append((-ratio, name, number))
+        for ratio, name, number in sorted(scored)[:limit]:
+            yield name, unpackNumber(number)
+
+    def searchNumber(self, digits, limit=SEARCH_LIMIT):
+        # a full number is looked up in its E.164 form first, so a trunk 0 or a missing country code still match,
+        # otherwise the digits are a suffix, one range of the fixed width reverse keys
+        rows = []
+        normalized = normalizeNumber(digits)
+        if normalized is not None:
+            rows = self.connection.execute('SELECT name, number FROM contacts WHERE number = ? ORDER BY name LIMIT ?',
+                                           (int(normalized[1:]), limit)).fetchall()
+        key = reversedDigits(digits)
+        if not rows and key and len(key) <= NUMBER_DIGITS:
+            rows = self.connection.execute('SELECT name, number FROM contacts WHERE number_reversed BETWEEN ? AND ? '
+                                           'ORDER BY number_reversed LIMIT ?', suffixRange(digits) + (limit,))
+        for name, number in rows:
+            yield name, unpackNumber(number)
+
+    def namesOfNumber(self, number):
+        normalized = normalizeNumber(number)
+        if normalized is None:
+            return []
+        return [row[0] for row in self.connection.execute('SELECT name FROM contacts WHERE number = ? ORDER BY name',
+                                                          (int(normalized[1:]),))]
+
+    def findDuplicates(self, limit=SEARCH_LIMIT):
+        # the number index gives the contacts grouped by number without sorting the table
+        rows = self.connection.execute('SELECT number FROM contacts GROUP BY number HAVING COUNT(*) > 1 '
+                                       'ORDER BY number LIMIT ?', (limit,)).fetchall()
+        return [(unpackNumber(number), self.namesOfNumber(unpackNumber(number))) for number, in rows]
+
+    def close(self):
+        self.connection.close()
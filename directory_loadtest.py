@@ -0,0 +1,191 @@
+"""
+Load test of the telephone directory service
+many keep-alive connections send a seeded mix of lookups, searches, updates and batched writes for a fixed time
+and the script reports requests/sec and the latency percentiles of every kind of request
+without --port it starts directory_service.py on a temporary directory file and preloads it
+usage: python directory_loadtest.py --connections 32 --duration 10 --write-ratio 0.1 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+from benchmark_report import addReportArguments, newReport, percentile, writeReport
+
+HOST = '127.0.0.1'
+
+
+"""One keep-alive HTTP/1.1 connection to the service."""
+class Connection:
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    """Send the request and return the status and the JSON body of the response."""
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.writer.write(('%s %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                           % (method, path, self.host, len(body))).encode('latin-1') + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            if key.strip().lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length)) if length else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def contactName(number):
+    return 'Contact ' + str(number)
+
+
+def contactNumber(generator):
+    return '9' + ''.join(generator.choice('0123456789') for _ in range(9))
+
+
+"""Add the contacts the test reads with batch requests."""
+async def preload(host, port, contacts, batchSize, seed):
+    generator = random.Random(seed)
+    connection = Connection(host, port)
+    await connection.open()
+    for start in range(0, contacts, batchSize):
+        operations = [{'op': 'add', 'name': contactName(number), 'number': contactNumber(generator)}
+                      for number in range(start, min(contacts, start + batchSize))]
+        status, body = await connection.request('POST', '/contacts/batch', {'operations': operations})
+        if status != 200:
+            raise RuntimeError('preload failed: ' + str(body))
+    connection.close()
+
+
+"""Send requests until the deadline, record the latency of every one by its kind."""
+async def client(host, port, args, seed, deadline, latencies, errors):
+    generator = random.Random(seed)
+    connection = Connection(host, port)
+    await connection.open()
+    try:
+        while time.perf_counter() < deadline:
+            number = generator.randrange(args.contacts)
+            draw = generator.random()
+            if draw < args.write_ratio:
+                if args.batch_size > 1:
+                    kind = 'batch'
+                    operations = [{'op': 'update', 'name': contactName(generator.randrange(args.contacts)),
+                                   'number': contactNumber(generator)} for _ in range(args.batch_size)]
+                    request = ('POST', '/contacts/batch', {'operations': operations})
+                else:
+                    kind = 'update'
+                    request = ('PUT', '/contacts/' + urllib.parse.quote(contactName(number)),
+                               {'number': contactNumber(generator)})
+            elif draw < args.write_ratio + args.search_ratio:
+                kind = 'search'
+                request = ('GET', '/search?name=' + urllib.parse.quote(contactName(number)[:-1]) + '&limit=10', None)
+            else:
+                kind = 'get'
+                request = ('GET', '/contacts/' + urllib.parse.quote(contactName(number)), None)
+            start = time.perf_counter()
+            status, body = await connection.request(*request)
+            latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            if status >= 400:
+                errors[kind] = errors.get(kind, 0) + 1
+    finally:
+        connection.close()
+
+
+async def loadTest(host, port, args):
+    latencies = {}
+    errors = {}
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*[client(host, port, args, args.seed + index, deadline, latencies, errors)
+                           for index in range(args.connections)])
+    seconds = time.perf_counter() - start
+    allLatencies = [latency for kind in latencies.values() for latency in kind]
+
+    def summary(values):
+        return {'requests': len(values),
+                'p50Ms': percentile(values, 50) * 1000,
+                'p90Ms': percentile(values, 90) * 1000,
+                'p99Ms': percentile(values, 99) * 1000,
+                'maxMs': max(values, default=0) * 1000}
+    report = summary(allLatencies)
+    report.update({'seconds': seconds,
+                   'requestsPerSecond': len(allLatencies) / seconds,
+                   'errors': errors,
+                   'kinds': {kind: summary(values) for kind, values in latencies.items()}})
+    return report
+
+
+def freePort():
+    with socket.socket() as probe:
+        probe.bind((HOST, 0))
+        return probe.getsockname()[1]
+
+
+"""Start directory_service.py on the directory file, return the process and its port."""
+def startService(path, workers):
+    port = freePort()
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             'directory_service.py'),
+                                '--port', str(port), '--db', path, '--workers', str(workers)],
+                               stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()
+    return process, port
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='load test the telephone directory service')
+    parser.add_argument('--host', default=HOST, help='the address of the service')
+    parser.add_argument('--port', type=int, default=None, help='the port of a running service, '
+                                                               'without it a service is started on a temporary file')
+    parser.add_argument('--workers', type=int, default=8, help='the worker threads of the started service')
+    parser.add_argument('--connections', type=int, default=32, help='the number of concurrent connections')
+    parser.add_argument('--duration', type=float, default=10, help='the test time in seconds')
+    parser.add_argument('--contacts', type=int, default=10000, help='the number of contacts the requests use')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='the part of the requests which write')
+    parser.add_argument('--search-ratio', type=float, default=0.2, help='the part of the requests which search')
+    parser.add_argument('--batch-size', type=int, default=1, help='the updates of every write request, '
+                                                                  'more than 1 sends them as a batch')
+    addReportArguments(parser)
+    args = parser.parse_args()
+
+    process = None
+    port = args.port
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            if port is None:
+                process, port = startService(os.path.join(directory, 'contacts.db'), args.workers)
+                asyncio.run(preload(args.host, port, args.contacts, 1000, args.seed))
+            report = asyncio.run(loadTest(args.host, port, args))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+    report.update(newReport(args))
+    print(str(report['requests']) + ' requests in ' + str(round(report['seconds'], 2)) + ' seconds: '
+          + str(round(report['requestsPerSecond'])) + ' requests/sec, latency p50/p90/p99 '
+          + '/'.join(str(round(report[key], 2)) for key in ('p50Ms', 'p90Ms', 'p99Ms')) + ' ms, errors '
+          + str(report['errors']))
+    for kind, kindReport in sorted(report['kinds'].items()):
+        print('  ' + kind + ': ' + str(kindReport['requests']) + ' requests, p99 '
+              + str(round(kindReport['p99Ms'], 2)) + ' ms')
+    writeReport(report, args.output)
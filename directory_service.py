@@ -0,0 +1,483 @@
+"""
+Telephone directory service
+DirectoryService is the core of the telephone directory, the to-do app menu and the HTTP/JSON API both use it,
+it can be called from many threads at once: every thread reads through its own SQLite connection
+(WAL mode lets the readers run next to the writer) and the writes are serialized by one lock,
+every committed write is appended to the change journal and the directory is snapshotted every SNAPSHOT_EVERY changes
+(see contact_journal.py, an import is snapshotted once when it is done), one process at a time writes a directory file
+DirectoryServer serves it over HTTP/1.1 with asyncio, the SQLite calls run on a thread pool
+
+    GET    /contacts?after=<name>&size=<n>   a page of contacts in name order, next is the cursor of the next page
+    POST   /contacts                         {"name": ..., "number": ...} add (or replace) a contact
+    POST   /contacts/batch                   {"operations": [{"op": "add" | "update" | "delete", "name": ..., "number": ...}]}
+                                             all the operations in one transaction
+    GET    /contacts/<name>                  the number of the name
+    PUT    /contacts/<name>                  {"number": ...} set the number of the name
+    DELETE /contacts/<name>                  remove the contact
+    GET    /search?name=<text>&limit=<n>     exact name, then names starting with the text, then similar names
+    GET    /search?number=<digits>&limit=<n> contacts with the number (in any form) or whose number ends with the digits
+    GET    /duplicates?limit=<n>             numbers saved under more than one name
+    GET    /history/<name>                   every change of the name from the journal
+
+usage: python directory_service.py --port 8080 --db contacts.db
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import contact_io
+from contact_journal import (ChangeJournal, journalPath, snapshotDirectory, restoreSnapshot, takeSnapshot,
+                             SNAPSHOT_EVERY)
+from contact_store import (SQLiteContactStore, DIRECTORY_FILE, SEARCH_LIMIT, PAGE_SIZE, normalizeNumber,
+                           packNumber)
+
+HOST = '127.0.0.1'
+PORT = 8080
+WORKERS = 8
+MAX_BODY = 16 * 1024 * 1024
+MAX_PAGE = 1000
+BATCH_OPERATIONS = ('add', 'update', 'delete')
+STATUS_TEXT = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+"""The E.164 form of the number, raise ValueError if it is not a phone number."""
+def checkNumber(number):
+    normalized = normalizeNumber(number)
+    if normalized is None:
+        raise ValueError('not a phone number: ' + str(number))
+    return normalized
+
+
+"""The telephone directory operations, safe to call from many threads.
+storeFactory gets the path and opens a store, every thread which uses the service gets its own one.
+With journal=True (an SQLite directory) the changes are journaled: on startup a lost directory file is restored
+from the latest snapshot and the journal tail after the last change of the directory is replayed."""
+class DirectoryService:
+
+    def __init__(self, path=DIRECTORY_FILE, storeFactory=SQLiteContactStore, journal=True,
+                 snapshotEvery=SNAPSHOT_EVERY):
+        self.path = path
+        self.storeFactory = storeFactory
+        self.writeLock = threading.Lock()
+        self.local = threading.local()
+        self.stores = []
+        self.storesLock = threading.Lock()
+        self.journal = None
+        self.snapshots = snapshotDirectory(path)
+        self.snapshotEvery = snapshotEvery
+        self.snapshotThread = None
+        self.sinceSnapshot = 0
+        # while an import runs no snapshot is taken, it is taken once the import is done
+        self.importing = 0
+        self.restored = None
+        if journal:
+            if not os.path.exists(path):
+                self.restored = restoreSnapshot(path, self.snapshots)
+            self.journal = ChangeJournal(journalPath(path))
+        # the first store runs the schema migrations before any other thread connects
+        self.getStore()
+        self.replayed = self.replay() if journal else 0
+
+    """The store of the calling thread."""
+    def getStore(self):
+        store = getattr(self.local, 'store', None)
+        if store is None:
+            with self.storesLock:
+                store = self.storeFactory(self.path)
+                self.stores.append(store)
+            self.local.store = store
+        return store
+
+    """Apply the journal records after the last change the directory has, return how many were applied."""
+    def replay(self):
+        store = self.getStore()
+        self.journal.seq = max(self.journal.seq, store.getMeta('journal_seq', 0))
+        if store.getMeta('journal_offset', 0) > self.journal.offset:
+            # the last change was committed but its record did not reach the journal, it goes on from its end
+            store.setMeta({'journal_offset': self.journal.offset})
+        replayed = 0
+        for record, offset in self.journal.read(store.getMeta('journal_offset', 0)):
+            meta = {'journal_seq': record['seq'], 'journal_offset': offset}
+            if 'import' in record:
+                store.addMany(record['import'], record.get('replace', False), meta, record.get('packed', False))
+            else:
+                store.applyBatch(record['changes'], meta)
+            replayed += 1
+        return replayed
+
+    """Write a change with write(meta), a store call which saves the meta values with the change, and append
+    its record to the journal once the store committed it: a change the store rejects is not journaled.
+    changes(result) is how many contacts the change wrote, a change which wrote none is not journaled
+    (the store saves no meta for it). Return the result of write. The caller holds the write lock."""
+    def writeJournaled(self, record, write, changes):
+        if self.journal is None:
+            return write(None)
+        data, seq, offset = self.journal.encode(record)
+        result = write({'journal_seq': seq, 'journal_offset': offset})
+        written = changes(result)
+        if written:
+            self.journal.write(record, data)
+            self.sinceSnapshot += written
+            self.startSnapshot()
+        return result
+
+    """Start a snapshot if SNAPSHOT_EVERY changes were written since the last one and no import runs.
+    The caller holds the write lock."""
+    def startSnapshot(self):
+        if (self.sinceSnapshot >= self.snapshotEvery and not self.importing
+                and not (self.snapshotThread and self.snapshotThread.is_alive())):
+            # the snapshot only reads the directory, the writes go on while it is taken
+            self.sinceSnapshot = 0
+            self.snapshotThread = threading.Thread(target=self.snapshot, daemon=True)
+            self.snapshotThread.start()
+
+    """Take a snapshot of the directory now, return its path."""
+    def snapshot(self):
+        return takeSnapshot(self.path, self.snapshots)
+
+    def add(self, name, number):
+        self.applyBatch([('add', name, number)])
+
+    def get(self, name):
+        return self.getStore().get(name)
+
+    """Set the number of the name, return True if the name existed."""
+    def update(self, name, number):
+        return self.applyBatch([('update', name, number)])[0]
+
+    """Remove the contact, return True if the name existed."""
+    def delete(self, name):
+        with self.writeLock:
+            store = self.getStore()
+            if store.get(name) is None:
+                return False
+            return self.writeJournaled({'changes': [['delete', name, None]]},
+                                       lambda meta: store.applyBatch([('delete', name, None)], meta), len)[0]
+
+    """Apply ('add' | 'update' | 'delete', name, number) operations in one transaction,
+    return for every operation True if the name existed before it."""
+    def applyBatch(self, operations):
+        operations = [[operation, name, None if operation == 'delete' else checkNumber(number)]
+                      for operation, name, number in operations]
+        with self.writeLock:
+            store = self.getStore()
+            return self.writeJournaled({'changes': operations}, lambda meta: store.applyBatch(operations, meta), len)
+
+    """Store a batch of (name, number) pairs, see ContactStore.addMany. The numbers are packed once here
+    (unless packed=True) and the journal and the store get the packed ones."""
+    def addMany(self, contacts, replace=False, packed=False):
+        if not packed:
+            contacts = [[name, packNumber(number)] for name, number in contacts]
+        with self.writeLock:
+            store = self.getStore()
+            # every duplicate of a replacing import is written again, see ContactStore.addMany
+            return self.writeJournaled({'import': contacts, 'replace': replace, 'packed': True},
+                                       lambda meta: store.addMany(contacts, replace, meta, packed=True),
+                                       lambda result: result[0] + (result[1] if replace else 0))
+
+    """Import a contacts file chunk by chunk (see contact_io.importContacts), the snapshot the import
+    is due is taken once at its end instead of after every chunk. Return the report dict."""
+    def importContacts(self, path, fileFormat=None, replace=False, progress=None):
+        with self.writeLock:
+            self.importing += 1
+        try:
+            return contact_io.importContacts(path, self, fileFormat, replace=replace, progress=progress)
+        finally:
+            with self.writeLock:
+                self.importing -= 1
+                if self.journal is not None:
+                    self.startSnapshot()
+
+    """Return (seq, time, op, number) of every journaled change of the name."""
+    def history(self, name):
+        return list(self.journal.history(name)) if self.journal is not None else []
+
+    """Return how the name was found ('exact', 'prefix', 'fuzzy' or None) and the found contacts:
+    the exact name, otherwise names starting with it, otherwise similar names (typos)."""
+    def search(self, name, limit=SEARCH_LIMIT):
+        store = self.getStore()
+        number = store.get(name)
+        if number is not None:
+            return 'exact', [(name, number)]
+        found = list(store.searchPrefix(name, limit))
+        if found:
+            return 'prefix', found
+        found = list(store.searchFuzzy(name, limit))
+        return ('fuzzy' if found else None), found
+
+    def searchNumber(self, digits, limit=SEARCH_LIMIT):
+        return list(self.getStore().searchNumber(digits, limit))
+
+    def namesOfNumber(self, number):
+        return self.getStore().namesOfNumber(number)
+
+    def findDuplicates(self, limit=SEARCH_LIMIT):
+        return self.getStore().findDuplicates(limit)
+
+    def page(self, after=None, size=PAGE_SIZE):
+        return self.getStore().page(after, size)
+
+    def iterPages(self, size=PAGE_SIZE, after=None):
+        return self.getStore().iterPages(size, after)
+
+    def iterContacts(self):
+        return self.getStore().iterContacts()
+
+    def count(self):
+        return self.getStore().count()
+
+    def close(self):
+        if self.snapshotThread is not None:
+            self.snapshotThread.join()
+        if self.journal is not None:
+            self.journal.close()
+        with self.storesLock:
+            for store in self.stores:
+                store.close()
+            self.stores = []
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def contactsJson(contacts):
+    return [{'name': name, 'number': number} for name, number in contacts]
+
+
+def readName(value):
+    if not isinstance(value, str) or not value.strip():
+        raise HttpError(400, 'name must be a non empty string')
+    return value.strip()
+
+
+def readNumber(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or not value.strip():
+        raise HttpError(400, 'number must be a non empty string')
+    return value.strip()
+
+
+def readInt(query, key, default, largest):
+    try:
+        value = int(query.get(key, default))
+    except ValueError:
+        raise HttpError(400, key + ' must be a number')
+    return max(1, min(value, largest))
+
+
+"""HTTP/JSON API of a DirectoryService (the routes are listed at the top of the module),
+the connections are kept alive and the service calls run on a thread pool of workers threads
+so the event loop keeps reading requests while SQLite works."""
+class DirectoryServer:
+
+    def __init__(self, service, workers=WORKERS):
+        self.service = service
+        self.executor = ThreadPoolExecutor(workers)
+        self.server = None
+
+    """Start listening, return the port (port 0 picks a free one)."""
+    async def start(self, host=HOST, port=PORT):
+        self.server = await asyncio.start_server(self.handleConnection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serveForever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.executor.shutdown()
+
+    async def handleConnection(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    return
+                parts = requestLine.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self.respond(writer, 400, {'error': 'bad request line'}, False)
+                    return
+                method, target, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keepAlive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+                length = headers.get('content-length', '0')
+                if not length.isdigit():
+                    await self.respond(writer, 400, {'error': 'bad content-length'}, False)
+                    return
+                if int(length) > MAX_BODY:
+                    await self.respond(writer, 413, {'error': 'the body is bigger than ' + str(MAX_BODY)}, False)
+                    return
+                body = await reader.readexactly(int(length)) if int(length) else b''
+                status, payload = await self.dispatch(method, target, body)
+                await self.respond(writer, status, payload, keepAlive)
+                if not keepAlive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keepAlive):
+        body = json.dumps(payload).encode('utf-8')
+        head = ('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n'
+                % (status, STATUS_TEXT[status], len(body), 'keep-alive' if keepAlive else 'close'))
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    """Return the status and the JSON payload of the request."""
+    async def dispatch(self, method, target, body):
+        try:
+            status, call = self.route(method, target, body)
+            return status, await asyncio.get_running_loop().run_in_executor(self.executor, call)
+        except HttpError as error:
+            return error.status, {'error': error.message}
+        except ValueError as error:
+            # the store rejects numbers which are not phone numbers
+            return 400, {'error': str(error)}
+        except Exception as error:
+            return 500, {'error': str(error)}
+
+    """Return the success status of the request and the function which does it on a worker thread."""
+    def route(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        path = url.path.rstrip('/')
+        service = self.service
+        if path == '/contacts':
+            if method == 'GET':
+                size = readInt(query, 'size', PAGE_SIZE, MAX_PAGE)
+                return 200, lambda: self.listPage(query.get('after'), size)
+            if method == 'POST':
+                data = self.readBody(body)
+                name, number = readName(data.get('name')), readNumber(data.get('number'))
+                return 201, lambda: self.addContact(name, number)
+            raise HttpError(405, method + ' is not allowed on /contacts')
+        if path == '/contacts/batch':
+            if method != 'POST':
+                raise HttpError(405, 'use POST for batches')
+            operations = self.readOperations(self.readBody(body))
+            return 200, lambda: {'existed': service.applyBatch(operations)}
+        if path.startswith('/contacts/'):
+            name = readName(urllib.parse.unquote(path[len('/contacts/'):]))
+            if method == 'GET':
+                return 200, lambda: self.getContact(name)
+            if method == 'PUT':
+                number = readNumber(self.readBody(body).get('number'))
+                return 200, lambda: {'name': name, 'number': number, 'existed': service.update(name, number)}
+            if method == 'DELETE':
+                return 200, lambda: self.deleteContact(name)
+            raise HttpError(405, method + ' is not allowed on a contact')
+        if path == '/search':
+            if method != 'GET':
+                raise HttpError(405, 'use GET for searches')
+            limit = readInt(query, 'limit', SEARCH_LIMIT, MAX_PAGE)
+            if 'number' in query:
+                digits = query['number']
+                return 200, lambda: {'contacts': contactsJson(service.searchNumber(digits, limit))}
+            name = readName(query.get('name'))
+            return 200, lambda: self.searchName(name, limit)
+        if path.startswith('/history/'):
+            if method != 'GET':
+                raise HttpError(405, 'use GET for history')
+            name = readName(urllib.parse.unquote(path[len('/history/'):]))
+            return 200, lambda: {'name': name, 'changes': [{'seq': seq, 'time': changed, 'op': operation,
+                                                            'number': number}
+                                                           for seq, changed, operation, number in service.history(name)]}
+        if path == '/duplicates':
+            if method != 'GET':
+                raise HttpError(405, 'use GET for duplicates')
+            limit = readInt(query, 'limit', SEARCH_LIMIT, MAX_PAGE)
+            return 200, lambda: {'duplicates': [{'number': number, 'names': names}
+                                                for number, names in service.findDuplicates(limit)]}
+        raise HttpError(404, 'no route ' + url.path)
+
+    def readBody(self, body):
+        try:
+            data = json.loads(body.decode('utf-8') or '{}')
+        except (UnicodeDecodeError, ValueError):
+            raise HttpError(400, 'the body is not JSON')
+        if not isinstance(data, dict):
+            raise HttpError(400, 'the body must be a JSON object')
+        return data
+
+    def readOperations(self, data):
+        operations = data.get('operations')
+        if not isinstance(operations, list):
+            raise HttpError(400, 'operations must be a list')
+        checked = []
+        for operation in operations:
+            if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+                raise HttpError(400, 'every operation needs op, one of ' + ', '.join(BATCH_OPERATIONS))
+            name = readName(operation.get('name'))
+            number = None if operation['op'] == 'delete' else readNumber(operation.get('number'))
+            checked.append((operation['op'], name, number))
+        return checked
+
+    def listPage(self, after, size):
+        contacts = self.service.page(after, size)
+        return {'contacts': contactsJson(contacts), 'next': contacts[-1][0] if len(contacts) == size else None}
+
+    def addContact(self, name, number):
+        self.service.add(name, number)
+        return {'name': name, 'number': number}
+
+    def getContact(self, name):
+        number = self.service.get(name)
+        if number is None:
+            raise HttpError(404, 'no contact ' + name)
+        return {'name': name, 'number': number}
+
+    def deleteContact(self, name):
+        if not self.service.delete(name):
+            raise HttpError(404, 'no contact ' + name)
+        return {'deleted': name}
+
+    def searchName(self, name, limit):
+        match, contacts = self.service.search(name, limit)
+        return {'match': match, 'contacts': contactsJson(contacts)}
+
+
+async def serve(service, host=HOST, port=PORT, workers=WORKERS):
+    server = DirectoryServer(service, workers)
+    port = await server.start(host, port)
+    print('directory service on http://' + host + ':' + str(port), flush=True)
+    try:
+        await server.serveForever()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='serve the telephone directory over HTTP/JSON')
+    parser.add_argument('--host', default=HOST, help='the address to listen on')
+    parser.add_argument('--port', type=int, default=PORT, help='the port to listen on, 0 picks a free one')
+    parser.add_argument('--db', default=DIRECTORY_FILE, help='the SQLite directory file')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='the number of threads running store calls')
+    args = parser.parse_args()
+
+    directory = DirectoryService(args.db)
+    try:
+        asyncio.run(serve(directory, args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        directory.close()
@@ -0,0 +1,224 @@
+"""
+Shared HTTP client of the to-do app (weather, news)
+one requests.Session keeps the connections alive (a pool per host), every request has a timeout and
+failed connections and 429/5xx answers are retried with backoff
+the answers are cached by the normalized URL in memory (LRU) and on disk (one JSON file per URL, so the cache
+lives between runs), both with a TTL, a cached answer costs no network round trip
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'http-cache')
+CACHE_TTL = 600
+MEMORY_ENTRIES = 256
+DISK_ENTRIES = 2048
+# (connect, read) seconds
+TIMEOUT = (3.05, 10)
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# the answers which are the same when asked again, the others are never cached
+CACHE_STATUSES = (200, 203, 404, 410)
+POOL_SIZE = 10
+# the headers kept with an answer, the validators of conditional requests among them
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# the query parameters which hold API keys, they are not written to the disk cache
+SECRET_PARAMS = ('appid', 'apikey', 'api_key', 'key', 'token', 'access_token')
+
+
+"""The cache key of the URL: lower case scheme and host, no default port, no fragment
+and the query parameters (with params) sorted."""
+def normalizeUrl(url, params=None):
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        host += ':' + str(parts.port)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(key, str(value)) for key, value in params.items()]
+    return urllib.parse.urlunsplit((scheme, host, parts.path or '/', urllib.parse.urlencode(sorted(query)), ''))
+
+
+"""The URL with the values of the SECRET_PARAMS query parameters replaced by ***."""
+def redactUrl(url):
+    parts = urllib.parse.urlsplit(url)
+    query = [(key, '***' if key.lower() in SECRET_PARAMS else value)
+             for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query, safe='*')))
+
+
+def keyHash(key):
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+"""The status, headers and body of an answer, fromCache tells whether it came without a request."""
+class CachedResponse:
+
+    def __init__(self, url, status, headers, body, fromCache=False):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.fromCache = fromCache
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.body)
+
+    def text(self):
+        return self.body.decode('utf-8', 'replace')
+
+
+"""TTL cache of answers by the normalized URL, the newest memoryEntries are kept in memory,
+diskEntries on disk (in directory, None for memory only), the least recently used are evicted.
+A disk entry keeps the hash of its key and the URL without its API keys (see redactUrl)."""
+class ResponseCache:
+
+    def __init__(self, directory=HTTP_CACHE, memoryEntries=MEMORY_ENTRIES, diskEntries=DISK_ENTRIES):
+        self.directory = directory
+        self.memoryEntries = memoryEntries
+        self.diskEntries = diskEntries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, keyHash(key) + '.json')
+
+    """The cached response of the key, None if it is not cached or expired."""
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.memory.move_to_end(key)
+                    return CachedResponse(key, *entry[1:], fromCache=True)
+                del self.memory[key]
+        if self.directory is None:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as cacheFile:
+                stored = json.load(cacheFile)
+        except (OSError, ValueError):
+            return None
+        if stored['expires'] <= now or stored.get('hash') != keyHash(key):
+            return None
+        # the modification time orders the disk entries for the eviction
+        os.utime(path)
+        entry = (stored['expires'], stored['status'], stored['headers'], stored['body'].encode('latin-1'))
+        self.remember(key, entry)
+        return CachedResponse(key, *entry[1:], fromCache=True)
+
+    def put(self, key, response, ttl):
+        entry = (time.time() + ttl, response.status, response.headers, response.body)
+        self.remember(key, entry)
+        if self.directory is None:
+            return
+        path = self.path(key)
+        temporary = path + '.' + str(threading.get_ident()) + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as cacheFile:
+            json.dump({'hash': keyHash(key), 'url': redactUrl(key), 'expires': entry[0], 'status': entry[1],
+                       'headers': entry[2], 'body': entry[3].decode('latin-1')}, cacheFile)
+        os.replace(temporary, path)
+        self.evictDisk()
+
+    def remember(self, key, entry):
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memoryEntries:
+                self.memory.popitem(last=False)
+
+    def evictDisk(self):
+        names = [name for name in os.listdir(self.directory) if name.endswith('.json')]
+        if len(names) <= self.diskEntries:
+            return
+        paths = sorted((os.path.join(self.directory, name) for name in names), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.diskEntries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.directory, name))
+
+
+"""GET requests through one pooled session with timeouts and retries, the answers are cached
+for ttl seconds. cache=None makes a ResponseCache in HTTP_CACHE."""
+class HttpClient:
+
+    def __init__(self, cache=None, ttl=CACHE_TTL, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF,
+                 poolSize=POOL_SIZE):
+        self.cache = cache if cache is not None else ResponseCache()
+        self.ttl = ttl
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    """The response of url with the query params from the network, never cached. headers are sent
+    with the request, like If-None-Match for a conditional request (the answer is 304 if nothing changed).
+    Raises requests.RequestException if the request fails after the retries."""
+    def fetch(self, url, params=None, headers=None):
+        key = normalizeUrl(url, params)
+        answer = self.session.get(key, headers=headers, timeout=self.timeout)
+        return CachedResponse(key, answer.status_code,
+                              {name: answer.headers[name] for name in KEPT_HEADERS if name in answer.headers},
+                              answer.content)
+
+    """The response of url with the query params, from the cache if it has a fresh one.
+    Raises requests.RequestException if the request fails after the retries."""
+    def get(self, url, params=None, ttl=None):
+        key = normalizeUrl(url, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        response = self.fetch(key)
+        if response.status in CACHE_STATUSES:
+            self.cache.put(key, response, self.ttl if ttl is None else ttl)
+        return response
+
+    def getJson(self, url, params=None, ttl=None):
+        return self.get(url, params, ttl).json()
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_clientLock = threading.Lock()
+
+
+"""The HttpClient every part of the app shares, made on the first call."""
+def sharedClient():
+    global _client
+    with _clientLock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
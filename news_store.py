@@ -0,0 +1,229 @@
+"""
+Local store of the news articles
+NewsFeed polls the news sources every NEWS_POLL seconds on the timer engine (the requests run on their own thread,
+never on the timer thread) with conditional requests: the ETag and Last-Modified of the last answer are sent back,
+and an unchanged feed answers 304 without a body
+new articles go to NewsStore, a SQLite file with a full text index (FTS5) over the titles, an article whose URL
+or content (title and description) is already stored is skipped
+reading the news reads the store, so it costs no request and no API quota
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from http_client import normalizeUrl, sharedClient
+
+NEWS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news.db')
+NEWS_URL = 'https://newsapi.org/v1/articles'
+NEWS_KEY = 'YOUR NEWS API KEY HERE'
+NEWS_SOURCES = ['bbc-news']
+# 96 polls a day for a source, within the 100 requests a day of the free API key
+NEWS_POLL = 900
+NEWS_LIMIT = 20
+
+SCHEMA = ['CREATE TABLE IF NOT EXISTS articles (id INTEGER PRIMARY KEY, url TEXT UNIQUE NOT NULL, '
+          'hash TEXT UNIQUE NOT NULL, source TEXT NOT NULL, title TEXT NOT NULL, description TEXT, '
+          'published TEXT, fetched REAL NOT NULL)',
+          'CREATE INDEX IF NOT EXISTS articles_source ON articles (source, published)',
+          'CREATE TABLE IF NOT EXISTS feeds (source TEXT PRIMARY KEY, etag TEXT, modified TEXT, '
+          'polled REAL, status INTEGER)']
+# the full text index keeps no copy of the titles (content=articles), the triggers keep it in step
+FTS_SCHEMA = ["CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(title, content='articles', "
+              "content_rowid='id')",
+              'CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles BEGIN '
+              'INSERT INTO articles_fts (rowid, title) VALUES (new.id, new.title); END',
+              'CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles BEGIN '
+              "INSERT INTO articles_fts (articles_fts, rowid, title) VALUES ('delete', old.id, old.title); END"]
+
+
+"""The hash of the text of an article, the same story under another URL has the same hash."""
+def contentHash(title, description):
+    text = ' '.join((str(title or '') + '\n' + str(description or '')).lower().split())
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+"""An FTS5 query which finds the titles having every word of the text (the last one as a prefix)."""
+def matchQuery(text):
+    words = [word.replace('"', '""') for word in text.split()]
+    return ' '.join('"' + word + '"' + ('*' if index == len(words) - 1 else '')
+                    for index, word in enumerate(words))
+
+
+class Article:
+    def __init__(self, url, source, title, description, published):
+        self.url = url
+        self.source = source
+        self.title = title
+        self.description = description
+        self.published = published
+
+    def __repr__(self):
+        return 'Article(%r, %r)' % (self.title, self.url)
+
+
+"""The articles and the state of every feed (its ETag, Last-Modified and last poll) in a SQLite file."""
+class NewsStore:
+
+    def __init__(self, path=NEWS_FILE):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.lock = threading.Lock()
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            # without FTS5 in the SQLite library the titles are searched with LIKE
+            try:
+                for statement in FTS_SCHEMA:
+                    self.connection.execute(statement)
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.fts = False
+
+    """Store the articles (dicts of the news API) of the source, return how many were new.
+    Articles without a URL or a title are skipped."""
+    def addArticles(self, source, articles):
+        rows = []
+        for article in articles:
+            if not article.get('url') or not article.get('title'):
+                continue
+            rows.append((normalizeUrl(article['url']), contentHash(article['title'], article.get('description')),
+                         source, article['title'], article.get('description'), article.get('publishedAt'),
+                         time.time()))
+        with self.lock, self.connection:
+            # a URL or a hash which is already stored makes the insert a no-op
+            return self.connection.executemany('INSERT OR IGNORE INTO articles (url, hash, source, title, '
+                                               'description, published, fetched) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                               rows).rowcount
+
+    """The newest articles (of the source), the newest first."""
+    def latest(self, source=None, limit=NEWS_LIMIT):
+        query = 'SELECT url, source, title, description, published FROM articles'
+        params = ()
+        if source is not None:
+            query += ' WHERE source = ?'
+            params = (source,)
+        with self.lock:
+            rows = self.connection.execute(query + ' ORDER BY published DESC, id DESC LIMIT ?',
+                                           params + (limit,)).fetchall()
+        return [Article(*row) for row in rows]
+
+    """The articles whose title has every word of the text, the best matches first."""
+    def search(self, text, limit=NEWS_LIMIT):
+        if not text.split():
+            return []
+        with self.lock:
+            if self.fts:
+                rows = self.connection.execute(
+                    'SELECT a.url, a.source, a.title, a.description, a.published FROM articles_fts '
+                    'JOIN articles a ON a.id = articles_fts.rowid WHERE articles_fts MATCH ? '
+                    'ORDER BY bm25(articles_fts) LIMIT ?', (matchQuery(text), limit)).fetchall()
+            else:
+                words = text.split()
+                rows = self.connection.execute(
+                    'SELECT url, source, title, description, published FROM articles WHERE '
+                    + ' AND '.join(['title LIKE ?'] * len(words)) + ' ORDER BY published DESC LIMIT ?',
+                    ['%' + word + '%' for word in words] + [limit]).fetchall()
+        return [Article(*row) for row in rows]
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM articles').fetchone()[0]
+
+    """The etag, modified, polled and status of the last poll of the source, all None if it was never polled."""
+    def getFeed(self, source):
+        with self.lock:
+            row = self.connection.execute('SELECT etag, modified, polled, status FROM feeds WHERE source = ?',
+                                          (source,)).fetchone()
+        return row if row is not None else (None, None, None, None)
+
+    def setFeed(self, source, etag, modified, status):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO feeds (source, etag, modified, polled, status) '
+                                    'VALUES (?, ?, ?, ?, ?)', (source, etag, modified, time.time(), status))
+
+    def close(self):
+        self.connection.close()
+
+
+"""Polls the sources into the store every interval seconds on the scheduler (a timers.py engine),
+the polls run on a thread of their own so a slow news API never delays the alarms."""
+class NewsFeed:
+
+    def __init__(self, store, sources=NEWS_SOURCES, client=None, url=NEWS_URL, key=NEWS_KEY, interval=NEWS_POLL):
+        self.store = store
+        self.sources = list(sources)
+        self.client = client if client is not None else sharedClient()
+        self.url = url
+        self.key = key
+        self.interval = interval
+        self.scheduler = None
+        self.call = None
+        self.polling = threading.Lock()
+
+    """Ask the source for articles changed since the last poll, return the number of new articles
+    (0 if the feed did not change). Raises requests.RequestException if the API cannot be reached."""
+    def poll(self, source):
+        etag, modified, polled, status = self.store.getFeed(source)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        response = self.client.fetch(self.url, {'source': source, 'sortBy': 'top', 'apiKey': self.key}, headers)
+        if response.status == 304:
+            self.store.setFeed(source, etag, modified, response.status)
+            return 0
+        if not response.ok:
+            self.store.setFeed(source, etag, modified, response.status)
+            raise requests.HTTPError('the news API answered ' + str(response.status) + ' for ' + source)
+        added = self.store.addArticles(source, response.json().get('articles', []))
+        self.store.setFeed(source, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                           response.status)
+        return added
+
+    """Poll every source, return a dict of the source to its new articles or its error."""
+    def pollAll(self):
+        results = {}
+        with self.polling:
+            for source in self.sources:
+                try:
+                    results[source] = self.poll(source)
+                except (requests.RequestException, ValueError) as error:
+                    results[source] = error
+        return results
+
+    """The seconds until a source is due, 0 if one was never polled."""
+    def nextPoll(self):
+        polls = [self.store.getFeed(source)[2] for source in self.sources]
+        return min((max(0.0, polled + self.interval - time.time()) if polled is not None else 0.0
+                    for polled in polls), default=self.interval)
+
+    """True if a news API key is set instead of the NEWS_KEY placeholder."""
+    def hasKey(self):
+        return bool(self.key) and self.key != NEWS_KEY
+
+    """True once start has scheduled the polls."""
+    def started(self):
+        return self.call is not None
+
+    """Poll when the first source is due (now if the app was closed longer than the interval)
+    and then every interval on the scheduler."""
+    def start(self, scheduler):
+        self.scheduler = scheduler
+        self.call = scheduler.callLater(self.nextPoll(), self.tick)
+
+    def tick(self):
+        # on the timer thread: only start the poll thread and schedule the next tick
+        if not self.polling.locked():
+            threading.Thread(target=self.pollAll, name='news', daemon=True).start()
+        self.call = self.scheduler.callLater(self.interval, self.tick)
+
+    def stop(self):
+        if self.call is not None:
+            self.scheduler.cancel(self.call)
+            self.call = None
@@ -0,0 +1,273 @@
+"""
+Notifications of the to-do app
+NotificationDispatcher gets notifications from any thread (the timer thread) without blocking it and sends them
+to its sinks on its own worker thread, notifications which come together (alarms which fire in the same tick)
+are coalesced to one
+the sinks: LogSink prints or logs, AudioSink plays an alert sound (the sound files are read once and cached,
+WAV files decoded to frames), DesktopSink shows a desktop notification and WebhookSink posts JSON to an endpoint
+a sink which is not available on the machine (no audio player, no notify-send) is skipped
+"""
+import abc
+import io
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import urllib.request
+import wave
+
+try:
+    import simpleaudio
+except ImportError:
+    simpleaudio = None
+
+try:
+    import winsound
+except ImportError:
+    winsound = None
+
+ALERT_SOUND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '1.mp3')
+COALESCE_WINDOW = 0.02
+WEBHOOK_TIMEOUT = 2
+# the local endpoint the notifications are posted to, no webhook if it is not set
+WEBHOOK_URL = os.environ.get('TODO_WEBHOOK')
+# players which read a sound file from stdin, the first one found is used
+PLAYERS = {'.wav': [['aplay', '-q', '-'], ['paplay'], ['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet', '-']],
+           '.mp3': [['mpg123', '-q', '-'], ['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet', '-']]}
+
+
+"""title and message of a notification, kind is the kind of what fired it ('alarm', 'todo', ...),
+count is how many notifications were coalesced to it and kinds the kinds of those notifications."""
+class Notification:
+
+    def __init__(self, title, message='', kind='info', count=1, kinds=None):
+        self.title = title
+        self.message = message
+        self.kind = kind
+        self.count = count
+        self.kinds = frozenset(kinds) if kinds is not None else frozenset((kind,))
+        self.time = time.time()
+
+    def toJson(self):
+        return {'title': self.title, 'message': self.message, 'kind': self.kind, 'count': self.count,
+                'time': self.time}
+
+    def __repr__(self):
+        return 'Notification(%r, %r, %s, %d)' % (self.title, self.message, self.kind, self.count)
+
+
+"""One notification for notifications which fired together."""
+def coalesce(notifications):
+    if len(notifications) == 1:
+        return notifications[0]
+    kinds = {notification.kind for notification in notifications}
+    kind = kinds.pop() if len(kinds) == 1 else 'mixed'
+    return Notification(str(len(notifications)) + ' ' + (kind + 's' if kind != 'mixed' else 'notifications'),
+                        '\n'.join(notification.title + (': ' + notification.message if notification.message else '')
+                                  for notification in notifications),
+                        kind, sum(notification.count for notification in notifications),
+                        frozenset().union(*(notification.kinds for notification in notifications)))
+
+
+"""Where notifications go, kinds limits the kinds of notifications the sink gets (None for all)."""
+class Sink(abc.ABC):
+
+    def __init__(self, kinds=None):
+        self.kinds = kinds
+
+    # a coalesced notification goes to the sink if one of the notifications in it is of its kinds
+    def accepts(self, notification):
+        return self.kinds is None or not notification.kinds.isdisjoint(self.kinds)
+
+    def available(self):
+        return True
+
+    """Send the notification, the dispatcher thread waits for it."""
+    @abc.abstractmethod
+    def send(self, notification):
+        pass
+
+    def close(self):
+        pass
+
+
+"""Prints the notifications, or writes them with write (a function which gets a line, like logging.info)."""
+class LogSink(Sink):
+
+    def __init__(self, write=None, kinds=None):
+        super().__init__(kinds)
+        self.write = write
+
+    def send(self, notification):
+        line = time.strftime('%H:%M:%S', time.localtime(notification.time)) + ' ' + notification.title + (
+            '\n' + notification.message if notification.message else '')
+        if self.write is None:
+            print('\n' + line)
+        else:
+            self.write(line)
+
+
+"""Plays a sound for every notification without waiting for it to end.
+The sound files are read once, WAV files are decoded to frames which simpleaudio (if it is installed)
+plays directly, otherwise the cached file goes to winsound on Windows or to the stdin of a player
+(aplay, paplay, mpg123 or ffplay) on the other systems. Sounds winsound can not play (1.mp3) are opened
+with the default player of Windows (os.startfile)."""
+class AudioSink(Sink):
+
+    def __init__(self, sound=ALERT_SOUND, kinds=('alarm', 'recurring')):
+        super().__init__(kinds)
+        self.sound = sound
+        self.cache = {}
+        self.playing = []
+        if os.path.exists(sound):
+            self.load(sound)
+
+    """Read (and decode) the sound file to the cache once, return the cache entry."""
+    def load(self, path):
+        if path not in self.cache:
+            with open(path, 'rb') as soundFile:
+                data = soundFile.read()
+            entry = {'data': data, 'extension': os.path.splitext(path)[1].lower()}
+            if entry['extension'] == '.wav':
+                with wave.open(io.BytesIO(data)) as decoded:
+                    entry['frames'] = decoded.readframes(decoded.getnframes())
+                    entry['format'] = (decoded.getnchannels(), decoded.getsampwidth(), decoded.getframerate())
+            entry['player'] = next((command for command in PLAYERS.get(entry['extension'], [])
+                                    if shutil.which(command[0])), None)
+            self.cache[path] = entry
+        return self.cache[path]
+
+    def available(self):
+        if not os.path.exists(self.sound):
+            return False
+        entry = self.load(self.sound)
+        return bool((simpleaudio and 'frames' in entry) or (winsound and entry['extension'] == '.wav')
+                    or entry['player'] or hasattr(os, 'startfile'))
+
+    def send(self, notification):
+        entry = self.load(self.sound)
+        # the players of the sounds before which have ended
+        self.playing = [player for player in self.playing if player.poll() is None]
+        if simpleaudio is not None and 'frames' in entry:
+            simpleaudio.play_buffer(entry['frames'], *entry['format'])
+        elif winsound is not None and entry['extension'] == '.wav':
+            # SND_MEMORY can not be combined with SND_ASYNC, the dispatcher thread waits, not the timers
+            winsound.PlaySound(entry['data'], winsound.SND_MEMORY)
+        elif entry['player'] is not None:
+            player = subprocess.Popen(entry['player'], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+            threading.Thread(target=player.communicate, args=(entry['data'],), daemon=True).start()
+            self.playing.append(player)
+        elif hasattr(os, 'startfile'):
+            # only on Windows, the player the file type is registered to plays it in its own process
+            os.startfile(self.sound)
+
+    def close(self):
+        for player in self.playing:
+            player.wait()
+
+
+"""Shows the notifications on the desktop with notify-send (Linux) or osascript (macOS)."""
+class DesktopSink(Sink):
+
+    def __init__(self, kinds=None):
+        super().__init__(kinds)
+        if shutil.which('notify-send'):
+            self.command = lambda notification: ['notify-send', notification.title, notification.message]
+        elif sys.platform == 'darwin' and shutil.which('osascript'):
+            self.command = lambda notification: ['osascript', '-e', 'display notification %s with title %s' % (
+                json.dumps(notification.message), json.dumps(notification.title))]
+        else:
+            self.command = None
+
+    def available(self):
+        # notify-send needs a desktop session
+        return self.command is not None and (sys.platform == 'darwin' or bool(os.environ.get('DISPLAY')
+                                                                              or os.environ.get('WAYLAND_DISPLAY')))
+
+    def send(self, notification):
+        subprocess.Popen(self.command(notification), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+"""Posts every notification as JSON to url (a local endpoint), a failed post is printed and dropped."""
+class WebhookSink(Sink):
+
+    def __init__(self, url, kinds=None, timeout=WEBHOOK_TIMEOUT):
+        super().__init__(kinds)
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notification):
+        request = urllib.request.Request(self.url, data=json.dumps(notification.toJson()).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+"""The sinks of the to-do app: the log, the alert sound, the desktop and the webhook if WEBHOOK_URL is set."""
+def defaultSinks():
+    sinks = [LogSink(), AudioSink(), DesktopSink()]
+    if WEBHOOK_URL:
+        sinks.append(WebhookSink(WEBHOOK_URL))
+    return sinks
+
+
+"""Sends notifications to the sinks on a worker thread. notify never blocks, the notifications which
+arrive within coalesceWindow seconds of the first queued one are sent as one. The sinks which are not available
+are dropped when the dispatcher starts."""
+class NotificationDispatcher:
+
+    def __init__(self, sinks, coalesceWindow=COALESCE_WINDOW):
+        self.sinks = [sink for sink in sinks if sink.available()]
+        self.coalesceWindow = coalesceWindow
+        self.queue = queue.Queue()
+        self.sent = 0
+        self.thread = threading.Thread(target=self.run, name='notifications', daemon=True)
+        self.thread.start()
+
+    def notify(self, notification):
+        self.queue.put(notification)
+
+    def run(self):
+        while True:
+            notification = self.queue.get()
+            if notification is None:
+                return
+            batch = [notification]
+            stop = False
+            # the notifications of the same tick come right after the first one, the window does not
+            # move with every one of them, so a steady stream is still sent every coalesceWindow
+            deadline = time.monotonic() + self.coalesceWindow
+            while True:
+                try:
+                    notification = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if notification is None:
+                    stop = True
+                    break
+                batch.append(notification)
+            self.dispatch(coalesce(batch))
+            if stop:
+                return
+
+    def dispatch(self, notification):
+        for sink in self.sinks:
+            if sink.accepts(notification):
+                try:
+                    sink.send(notification)
+                except Exception:
+                    traceback.print_exc()
+        self.sent += 1
+
+    """Send the queued notifications and stop the worker."""
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        for sink in self.sinks:
+            sink.close()
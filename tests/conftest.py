@@ -0,0 +1,12 @@
+"""
+the tests import the modules of the repo from its root directory, which also has calendar.py (the calendar
+of the to-do app) and it shadows the calendar module of the standard library (email.utils and http.server
+import it), so the root goes to the end of sys.path, after the standard library
+run the tests with `pytest tests`, not `python -m pytest` which puts the root first before this file runs
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path[:] = [path for path in sys.path if os.path.abspath(path or '.') != ROOT] + [ROOT]
@@ -0,0 +1,143 @@
+"""
+Stand-in server of the web APIs the to-do app uses, to test the HTTP client without the network
+it answers the OpenWeather weather and the NewsAPI articles paths with made up JSON on 127.0.0.1,
+keeps the connections alive like the real APIs and counts the requests and the connections,
+the 200 answers have an ETag and a Last-Modified header and a request with a matching If-None-Match gets 304,
+failNext makes the next requests of a path fail so the retries can be tested, delay makes every answer slow
+usage: python tests/stub_server.py --port 8081 (then point WEATHER_URL of weather.py and NEWS_URL of news_store.py at it)
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOST = '127.0.0.1'
+WEATHER_PATH = '/data/2.5/weather'
+NEWS_PATH = '/v1/articles'
+CITIES = {'london': (284.2, 1012, 81, 'light rain'), 'mumbai': (303.1, 1006, 74, 'haze'),
+          'delhi': (306.5, 1004, 38, 'clear sky'), 'new york': (291.7, 1018, 60, 'few clouds')}
+
+
+def weatherAnswer(query):
+    city = query.get('q', [''])[0].lower()
+    if city not in CITIES:
+        return 404, {'cod': '404', 'message': 'city not found'}
+    temperature, pressure, humidity, description = CITIES[city]
+    return 200, {'cod': 200, 'name': city.title(), 'main': {'temp': temperature, 'pressure': pressure,
+                                                           'humidity': humidity},
+                 'weather': [{'description': description}]}
+
+
+def newsAnswer(query):
+    source = query.get('source', ['bbc-news'])[0]
+    return 200, {'status': 'ok', 'source': source,
+                 'articles': [{'title': 'Headline %d of %s' % (number, source),
+                               'url': 'https://example.com/%s/%d' % (source, number),
+                               'description': 'Story %d' % number, 'publishedAt': '2020-01-0%dT00:00:00Z' % number}
+                              for number in range(1, 6)]}
+
+
+"""The stand-in server on a free port of 127.0.0.1, routes maps a path to a function which gets the
+parsed query and returns (status, JSON payload). hits counts the requests of every path and connections
+the TCP connections, notModified the 304 answers. Every answer waits delay seconds, like a far away server."""
+class StubServer:
+
+    def __init__(self, routes=None, port=0, delay=0):
+        self.routes = dict(routes) if routes is not None else {WEATHER_PATH: weatherAnswer, NEWS_PATH: newsAnswer}
+        self.hits = {}
+        self.connections = 0
+        self.notModified = 0
+        self.modified = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime())
+        self.failures = {}
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((HOST, port), self.handlerClass())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server.server_address
+
+    """Answer the next count requests of the path with the status."""
+    def failNext(self, path, count, status=503):
+        with self.lock:
+            self.failures[path] = (count, status)
+
+    def answer(self, path, query):
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+            count, status = self.failures.get(path, (0, 0))
+            if count:
+                self.failures[path] = (count - 1, status)
+                return status, {'error': 'stub failure'}
+        if path not in self.routes:
+            return 404, {'error': 'no route ' + path}
+        return self.routes[path](query)
+
+    def handlerClass(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                if stub.delay:
+                    time.sleep(stub.delay)
+                parts = urllib.parse.urlsplit(self.path)
+                status, payload = stub.answer(parts.path, urllib.parse.parse_qs(parts.query))
+                body = json.dumps(payload).encode('utf-8')
+                tag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+                if status == 200 and self.headers.get('If-None-Match') == tag:
+                    with stub.lock:
+                        stub.notModified += 1
+                    status, body = 304, b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if status in (200, 304):
+                    self.send_header('ETag', tag)
+                    self.send_header('Last-Modified', stub.modified)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exception):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='serve stand-in weather and news APIs')
+    parser.add_argument('--port', type=int, default=8081, help='the port to listen on')
+    parser.add_argument('--delay', type=float, default=0, help='the seconds every answer waits')
+    args = parser.parse_args()
+    stub = StubServer(port=args.port, delay=args.delay)
+    print('serving ' + stub.url)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
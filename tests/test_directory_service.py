@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from contact_store import SQLiteContactStore
+from directory_service import DirectoryService
+
+
+class FailingStore(SQLiteContactStore):
+
+    def write(self, name, number):
+        if name == 'Broken':
+            raise sqlite3.IntegrityError('rejected')
+        return super().write(name, number)
+
+
+def journalSeqs(service):
+    return [record['seq'] for record, offset in service.journal.read()]
+
+
+def test_rejected_batch_is_not_journaled(tmp_path):
+    service = DirectoryService(str(tmp_path / 'contacts.db'), storeFactory=FailingStore)
+    service.add('Ann', '+14155550100')
+    with pytest.raises(sqlite3.IntegrityError):
+        service.applyBatch([('add', 'Bob', '+14155550101'), ('add', 'Broken', '+14155550102')])
+    service.add('Cid', '+14155550103')
+    assert journalSeqs(service) == [1, 2]
+    assert service.get('Bob') is None
+    service.close()
+
+    reopened = DirectoryService(str(tmp_path / 'contacts.db'))
+    assert reopened.replayed == 0
+    assert [name for name, number in reopened.iterContacts()] == ['Ann', 'Cid']
+    reopened.close()
+
+
+def test_import_of_existing_names_is_not_journaled(tmp_path):
+    service = DirectoryService(str(tmp_path / 'contacts.db'))
+    assert service.addMany([('Ann', '+14155550100')]) == (1, 0)
+    assert service.addMany([('Ann', '+14155550199')]) == (0, 1)
+    assert service.delete('Nobody') is False
+    assert journalSeqs(service) == [1]
+    assert service.addMany([('Ann', '+14155550199')], replace=True) == (0, 1)
+    assert journalSeqs(service) == [1, 2]
+    service.close()
+
+
+def test_lost_journal_tail_is_replayed(tmp_path):
+    path = str(tmp_path / 'contacts.db')
+    service = DirectoryService(path)
+    service.add('Ann', '+14155550100')
+    service.snapshot()
+    service.add('Bob', '+14155550101')
+    service.close()
+    for suffix in ('', '-wal', '-shm'):
+        if (tmp_path / ('contacts.db' + suffix)).exists():
+            (tmp_path / ('contacts.db' + suffix)).unlink()
+
+    restored = DirectoryService(path)
+    assert restored.replayed == 1
+    assert restored.get('Bob') == '+14155550101'
+    restored.close()
@@ -0,0 +1,79 @@
+import pytest
+
+from http_client import HttpClient, ResponseCache
+from news_store import NewsStore, NewsFeed
+from stub_server import StubServer, WEATHER_PATH, NEWS_PATH
+from weather import fetchWeather, WeatherError
+
+
+@pytest.fixture
+def stub():
+    with StubServer() as server:
+        yield server
+
+
+def makeClient(tmp_path, retries=3):
+    return HttpClient(cache=ResponseCache(str(tmp_path / 'http-cache')), retries=retries, backoff=0)
+
+
+def test_memory_cache_hit(stub, tmp_path):
+    client = makeClient(tmp_path)
+    first = client.get(stub.url + WEATHER_PATH, {'q': 'London'})
+    second = client.get(stub.url + WEATHER_PATH, {'q': 'London'})
+    assert not first.fromCache and second.fromCache
+    assert second.json()['name'] == 'London'
+    assert stub.hits[WEATHER_PATH] == 1
+    client.close()
+
+
+def test_disk_cache_hit(stub, tmp_path):
+    client = makeClient(tmp_path)
+    client.get(stub.url + WEATHER_PATH, {'q': 'Delhi'})
+    client.close()
+    # a new client starts with an empty memory cache, the answer comes from the file
+    restarted = makeClient(tmp_path)
+    answer = restarted.get(stub.url + WEATHER_PATH, {'q': 'Delhi'})
+    assert answer.fromCache and answer.json()['name'] == 'Delhi'
+    assert stub.hits[WEATHER_PATH] == 1
+    restarted.close()
+
+
+def test_not_found_is_cached_and_errors_are_not(stub, tmp_path):
+    client = makeClient(tmp_path, retries=0)
+    assert client.get(stub.url + WEATHER_PATH, {'q': 'Atlantis'}).status == 404
+    assert client.get(stub.url + WEATHER_PATH, {'q': 'Atlantis'}).fromCache
+    stub.failNext(NEWS_PATH, 1, status=500)
+    assert client.get(stub.url + NEWS_PATH).status == 500
+    assert client.get(stub.url + NEWS_PATH).status == 200
+    client.close()
+
+
+def test_retry_on_server_error(stub, tmp_path):
+    client = makeClient(tmp_path)
+    stub.failNext(NEWS_PATH, 2, status=503)
+    answer = client.get(stub.url + NEWS_PATH, {'source': 'bbc-news'})
+    assert answer.status == 200
+    assert stub.hits[NEWS_PATH] == 3
+    # the retries reuse the pooled connection
+    assert stub.connections == 1
+    client.close()
+
+
+def test_not_modified_revalidation(stub, tmp_path):
+    client = makeClient(tmp_path)
+    feed = NewsFeed(NewsStore(str(tmp_path / 'news.db')), sources=['bbc-news'], client=client,
+                    url=stub.url + NEWS_PATH, key='test')
+    assert feed.poll('bbc-news') == 5
+    assert feed.poll('bbc-news') == 0
+    assert stub.notModified == 1
+    assert stub.hits[NEWS_PATH] == 2
+    assert len(feed.store.latest()) == 5
+    client.close()
+
+
+def test_weather_answer_which_is_not_an_object(stub, tmp_path):
+    stub.routes[WEATHER_PATH] = lambda query: (200, ['not', 'an', 'object'])
+    client = makeClient(tmp_path)
+    report = fetchWeather('London', client, url=stub.url + WEATHER_PATH)
+    assert isinstance(report, WeatherError) and report.status == 200
+    client.close()
@@ -0,0 +1,43 @@
+from notifications import Notification, NotificationDispatcher, Sink, coalesce
+
+
+"""a sink which keeps the notifications it gets"""
+class RecordingSink(Sink):
+
+    def __init__(self, kinds=None):
+        super().__init__(kinds)
+        self.sent = []
+
+    def send(self, notification):
+        self.sent.append(notification)
+
+
+def testCoalesceKeepsTheKinds():
+    batch = coalesce([Notification('tea', kind='countdown'), Notification('call mum', kind='todo')])
+    assert batch.kind == 'mixed'
+    assert batch.kinds == {'countdown', 'todo'}
+    assert batch.count == 2
+
+
+def testMixedBatchWithoutTheKindsOfTheSinkIsNotAccepted():
+    audio = RecordingSink(kinds=('alarm', 'recurring'))
+    batch = coalesce([Notification('tea', kind='countdown'), Notification('call mum', kind='todo')])
+    assert not audio.accepts(batch)
+    assert RecordingSink().accepts(batch)
+
+
+def testMixedBatchWithAnAlarmIsAccepted():
+    audio = RecordingSink(kinds=('alarm', 'recurring'))
+    assert audio.accepts(coalesce([Notification('wake up', kind='alarm'), Notification('call mum', kind='todo')]))
+
+
+def testDispatcherSendsMixedBatchOnlyToTheSinksOfItsKinds():
+    audio = RecordingSink(kinds=('alarm', 'recurring'))
+    log = RecordingSink()
+    # a long window so the two notifications are coalesced
+    dispatcher = NotificationDispatcher([audio, log], coalesceWindow=0.5)
+    dispatcher.notify(Notification('tea', kind='countdown'))
+    dispatcher.notify(Notification('call mum', kind='todo'))
+    dispatcher.close()
+    assert audio.sent == []
+    assert len(log.sent) == 1 and log.sent[0].count == 2
@@ -0,0 +1,179 @@
+"""
+NumPy scoring of many TicTac boards at once
+boards are stacked as (N, size, size) int8 arrays, 1 for 'O', -1 for 'X' and 0 for empty,
+and the 'O' and 'X' counts of all the lines of all the boards are computed with one matrix product
+BatchEvaluator can score the leaves of TicTac.Game.minmax2 in batches (Game.mLeafEvaluator)
+and this script is an offline analysis tool which plays millions of random games, scores their positions
+and fits the line weights of Game.getScoreLine to the results
+usage: python tictac_batch.py --size 5 --games 1000000 --output weights.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from TicTac import Board, Game, PLAYER, COMPUTER
+
+
+"""this function gets list of TicTac boards of the same size and return them as (N, size, size) int8 array"""
+def boardsToArray(boards):
+    size = boards[0].mSize
+    array = np.zeros((len(boards), size * size), dtype=np.int8)
+    for index, board in enumerate(boards):
+        for position in range(size * size):
+            rubric = board.getRubric(position)
+            if rubric == COMPUTER:
+                array[index, position] = 1
+            elif rubric == PLAYER:
+                array[index, position] = -1
+    return array.reshape(len(boards), size, size)
+
+
+"""
+this class score stacked boards of one size with a lines scores table like TicTac.Board.mLineScores,
+the table is indexed by the line code oSum * (size + 1) + xSum
+"""
+
+
+class BatchEvaluator:
+
+    """the constructor gets 2 arguments: size - the board size
+        scoreCounts - function which gets the 'O' and 'X' counts of a line and return its score,
+        like Game.getScoreCounts"""
+    def __init__(self, size, scoreCounts):
+        self.mSize = size
+        lines = Board.computeLines(size)
+        self.mLineMatrix = np.zeros((size * size, len(lines)), dtype=np.int16)
+        for index, line in enumerate(lines):
+            self.mLineMatrix[line, index] = 1
+        self.mLineScores = np.array([scoreCounts(code // (size + 1), code % (size + 1))
+                                     for code in range((size + 1) ** 2)], dtype=np.int64)
+        self.mWinScore = 10 ** (size + 1)
+
+    """this function gets (N, size, size) boards array and return the 'O' counts and the 'X' counts
+        of every line of every board as two (N, lines) arrays"""
+    def lineCounts(self, boards):
+        flat = boards.reshape(len(boards), -1)
+        oCounts = (flat == 1).astype(np.int16) @ self.mLineMatrix
+        xCounts = (flat == -1).astype(np.int16) @ self.mLineMatrix
+        return oCounts, xCounts
+
+    """this function gets (N, size, size) boards array and return the scores of the boards
+        like Game.evaluate - the sum of the lines scores"""
+    def score(self, boards):
+        oCounts, xCounts = self.lineCounts(boards)
+        return self.mLineScores[oCounts * (self.mSize + 1) + xCounts].sum(axis=1)
+
+    """this function gets (N, size, size) boards array and return the scores minmax2 gives them as leaves:
+        the win score if a line is complete, 0 if the board is full, and the score of the board otherwise"""
+    def scoreLeaves(self, boards):
+        oCounts, xCounts = self.lineCounts(boards)
+        scores = self.mLineScores[oCounts * (self.mSize + 1) + xCounts].sum(axis=1)
+        full = (boards.reshape(len(boards), -1) != 0).all(axis=1)
+        scores = np.where(full, 0, scores)
+        scores = np.where((oCounts == self.mSize).any(axis=1), self.mWinScore, scores)
+        scores = np.where((xCounts == self.mSize).any(axis=1), -self.mWinScore, scores)
+        return scores
+
+    """this function gets a TicTac board, moves and the side which moves (True for 'O')
+        and return the leaf scores of the boards after every move, it can be used as Game.mLeafEvaluator"""
+    def scoreChildren(self, board, moves, isMax):
+        children = np.repeat(boardsToArray([board]).reshape(1, -1), len(moves), axis=0)
+        children[np.arange(len(moves)), moves] = 1 if isMax else -1
+        return [int(score) for score in self.scoreLeaves(children.reshape(len(moves), self.mSize, self.mSize))]
+
+
+"""this function gets the board size, the number of games and a random generator and play random games,
+    it return one random position of every game as (N, size, size) array and the game results
+    (1 - 'O' won, -1 - 'X' won, 0 - tie), all the games are played together with array operations"""
+def playRandomGames(size, games, generator):
+    cells = size * size
+    lines = Board.computeLines(size)
+    lineMatrix = np.zeros((cells, len(lines)), dtype=np.int8)
+    for index, line in enumerate(lines):
+        lineMatrix[line, index] = 1
+    order = np.argsort(generator.random((games, cells)), axis=1)
+    firstSide = np.where(generator.random(games) < 0.5, 1, -1).astype(np.int8)
+    boards = np.zeros((games, cells), dtype=np.int8)
+    oCounts = np.zeros((games, len(lines)), dtype=np.int8)
+    xCounts = np.zeros((games, len(lines)), dtype=np.int8)
+    results = np.zeros(games, dtype=np.int8)
+    ended = np.zeros(games, dtype=bool)
+    endPly = np.full(games, cells)
+    rows = np.arange(games)
+    for ply in range(cells):
+        playing = ~ended
+        side = firstSide if ply % 2 == 0 else -firstSide
+        cell = order[:, ply]
+        boards[rows[playing], cell[playing]] = side[playing]
+        lineHits = lineMatrix[cell]
+        oCounts += lineHits * ((side == 1) & playing)[:, None]
+        xCounts += lineHits * ((side == -1) & playing)[:, None]
+        oWon = playing & (oCounts == size).any(axis=1)
+        xWon = playing & (xCounts == size).any(axis=1)
+        results[oWon] = 1
+        results[xWon] = -1
+        endPly[oWon | xWon] = ply + 1
+        ended |= oWon | xWon
+    # take a position from before the end of every game by replaying its first moves
+    samplePly = (generator.random(games) * endPly).astype(int)
+    positions = np.zeros((games, cells), dtype=np.int8)
+    for ply in range(cells):
+        taken = samplePly > ply
+        side = firstSide if ply % 2 == 0 else -firstSide
+        positions[rows[taken], order[taken, ply]] = side[taken]
+    return positions.reshape(games, size, size), results
+
+
+"""this function gets the board size, the positions and their results and fit the weight of every line type
+    (k 'O' only or k 'X' only, k = 1..size-1) with least squares, it return the fitted weights
+    and the correlation of the current evaluation and of the fitted evaluation with the results"""
+def fitWeights(size, positions, results, evaluator):
+    oCounts, xCounts = evaluator.lineCounts(positions)
+    features = []
+    names = []
+    for k in range(1, size):
+        features.append(((oCounts == k) & (xCounts == 0)).sum(axis=1))
+        names.append('O' + str(k))
+        features.append(((xCounts == k) & (oCounts == 0)).sum(axis=1))
+        names.append('X' + str(k))
+    matrix = np.stack(features, axis=1).astype(np.float64)
+    weights = np.linalg.lstsq(matrix, results.astype(np.float64), rcond=None)[0]
+    current = evaluator.score(positions).astype(np.float64)
+    fitted = matrix @ weights
+    return ({name: float(weight) for name, weight in zip(names, weights)},
+            float(np.corrcoef(current, results)[0, 1]),
+            float(np.corrcoef(fitted, results)[0, 1]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='score random TicTac positions and fit the line weights')
+    parser.add_argument('--size', type=int, default=5, help='the board size')
+    parser.add_argument('--games', type=int, default=1000000, help='the number of random games')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed')
+    parser.add_argument('--output', default=None, help='JSON file for the fitted weights')
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(args.seed)
+    evaluator = BatchEvaluator(args.size, Game(1, args.size).getScoreCounts)
+    start = time.time()
+    positions, results = playRandomGames(args.size, args.games, generator)
+    played = time.time()
+    weights, currentCorrelation, fittedCorrelation = fitWeights(args.size, positions, results, evaluator)
+    scored = time.time()
+    print('played ' + str(args.games) + ' games in ' + str(round(played - start, 2)) + ' seconds, scored and fitted in '
+          + str(round(scored - played, 2)) + ' seconds (' + str(round(args.games / (scored - played))) + ' positions/sec)')
+    print('results: O ' + str(int((results == 1).sum())) + ', X ' + str(int((results == -1).sum()))
+          + ', tie ' + str(int((results == 0).sum())))
+    print('correlation with the results: current weights ' + str(round(currentCorrelation, 4))
+          + ', fitted weights ' + str(round(fittedCorrelation, 4)))
+    # scale the fitted weights so the line with one 'O' is worth 1 like in getScoreLine
+    scale = weights['O1'] if weights['O1'] else 1
+    for name, weight in weights.items():
+        print(name + ': ' + str(round(weight / scale, 3)))
+    if args.output:
+        with open(args.output, 'w') as weightsFile:
+            json.dump({'size': args.size, 'games': args.games, 'seed': args.seed, 'weights': weights,
+                       'currentCorrelation': currentCorrelation, 'fittedCorrelation': fittedCorrelation},
+                      weightsFile, indent=2)
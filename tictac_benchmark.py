@@ -0,0 +1,104 @@
+"""
+this script benchmark the TicTac computer player without input and print
+it plays seeded self play games, two computer players against each other, on every board size
+and report the nodes per second, the depth reached on every move, the time to move percentiles
+and the results of the games, the report is also written as JSON so runs can be compared between commits
+usage: python tictac_benchmark.py --sizes 3 4 5 6 7 --games 2 --time 0.5 --output bench.json
+"""
+import argparse
+import random
+
+from TicTac import Game, GameState
+from benchmark_report import addReportArguments, newReport, percentile, writeReport
+
+
+"""this function gets the board size, the random seed, the number of random opening moves,
+    the search time and depth of every move and play one game between two computer players,
+    every player has its own Game which sees its rubrics as 'O', so both search as the computer,
+    it return the winner ('first', 'second' or 'tie') and the stats of every search"""
+def playGame(size, seed, randomMoves, timeLimit, maxDepth, useBook):
+    generator = random.Random(seed)
+    players = [Game(1, size), Game(1, size)]
+    for player in players:
+        player.mTurn = 1
+    moves = []
+    turn = 0
+    state = GameState.notEnd
+    while state == GameState.notEnd:
+        player = players[turn]
+        if len(moves) < randomMoves:
+            move = generator.choice(player.genrate())
+            stats = None
+        else:
+            move = player.getBestMove(timeLimit, maxDepth, useBook)
+            stats = player.getSearchStats()
+            stats['player'] = turn
+            stats.pop('depths')
+        players[turn].mBoard.drawO(move)
+        players[1 - turn].mBoard.drawX(move)
+        moves.append({'move': move, 'stats': stats})
+        state = players[turn].checkGameState()
+        turn = 1 - turn
+    for player in players:
+        player.close()
+    if state == GameState.tie:
+        result = 'tie'
+    else:
+        result = 'first' if turn == 1 else 'second'
+    return result, moves
+
+
+"""this function gets the board size and the benchmark arguments,
+    play the games of the size and return the report of the size"""
+def benchmarkSize(size, args):
+    results = {'first': 0, 'second': 0, 'tie': 0}
+    searches = []
+    for number in range(args.games):
+        result, moves = playGame(size, args.seed + number, args.random_moves, args.time, args.depth, args.book)
+        results[result] += 1
+        searches.extend(move['stats'] for move in moves if move['stats'] is not None)
+    searched = [stats for stats in searches if stats['source'] == 'search']
+    nodes = sum(stats['nodes'] for stats in searched)
+    totalTime = sum(stats['time'] for stats in searched)
+    times = [stats['time'] for stats in searches]
+    depths = [stats['depth'] for stats in searched]
+    return {'size': size,
+            'games': args.games,
+            'results': results,
+            'moves': len(searches),
+            'bookMoves': sum(1 for stats in searches if stats['source'] == 'book'),
+            'forcedMoves': sum(1 for stats in searches if stats['source'] == 'forced'),
+            'nodes': nodes,
+            'nodesPerSecond': nodes / totalTime if totalTime > 0 else 0,
+            'depth': {'min': min(depths, default=0),
+                      'mean': sum(depths) / len(depths) if depths else 0,
+                      'max': max(depths, default=0),
+                      'perMove': depths},
+            'timeToMove': {'p50': percentile(times, 50),
+                           'p90': percentile(times, 90),
+                           'p99': percentile(times, 99),
+                           'max': max(times, default=0)}}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the TicTac computer player with self play games')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[3, 4, 5, 6, 7], help='the board sizes')
+    parser.add_argument('--games', type=int, default=2, help='the number of games of every board size')
+    parser.add_argument('--random-moves', type=int, default=1, help='the number of random moves at the start of every game')
+    parser.add_argument('--time', type=float, default=0.5, help='the search time of every move in seconds')
+    parser.add_argument('--depth', type=int, default=None, help='the deepest depth of every search')
+    parser.add_argument('--book', action='store_true', help='let the players use the opening book')
+    addReportArguments(parser)
+    args = parser.parse_args()
+
+    report = newReport(args)
+    report['sizes'] = []
+    for size in args.sizes:
+        sizeReport = benchmarkSize(size, args)
+        report['sizes'].append(sizeReport)
+        print('size ' + str(size) + ': ' + str(round(sizeReport['nodesPerSecond'])) + ' nodes/sec, depth '
+              + str(sizeReport['depth']['min']) + '-' + str(sizeReport['depth']['max'])
+              + ' (mean ' + str(round(sizeReport['depth']['mean'], 1)) + '), time to move p50/p90/p99 '
+              + '/'.join(str(round(sizeReport['timeToMove'][key], 3)) for key in ('p50', 'p90', 'p99'))
+              + ', results ' + str(sizeReport['results']))
+    writeReport(report, args.output)
@@ -0,0 +1,82 @@
+"""
+this script build the opening book of the TicTac game offline
+it goes over all the positions with up to --plies rubrics taken where it is the computer turn,
+keeps one position of every group of symmetric positions, search the best move of every position
+and write them to the book file which TicTac.Game memory map when it starts
+usage: python tictac_book.py --size 5 --plies 3 --time 5
+"""
+import argparse
+import os
+import time
+
+import TicTac
+from TicTac import Game, OpeningBook, BOOK_FILE, GameState
+
+
+"""this function gets the board size and the number of plies and return the positions
+    (xMask, oMask, lastMove) where it is the computer turn and the game is not over,
+    one position for every canonical hash"""
+def generatePositions(size, plies):
+    game = Game(1, size, 1)
+    board = game.mBoard
+    positions = {}
+    # the computer can start (same number of 'X' and 'O') or the player can start (one 'X' more)
+    for computerFirst in (True, False):
+        layer = {board.getCanonicalHash()[0]: (0, 0, None)}
+        for ply in range(plies + 1):
+            nextLayer = {}
+            for xMask, oMask, lastMove in layer.values():
+                board.setPosition(xMask, oMask, lastMove)
+                if lastMove is not None and game.checkGameState() != GameState.notEnd:
+                    continue
+                computerTurn = (ply % 2 == 0) == computerFirst
+                if computerTurn:
+                    positions.setdefault(board.getCanonicalHash()[0], (xMask, oMask, lastMove))
+                if ply == plies:
+                    continue
+                for move in board.getEmptyPositions():
+                    if computerTurn:
+                        board.drawO(move)
+                    else:
+                        board.drawX(move)
+                    nextLayer.setdefault(board.getCanonicalHash()[0], (board.mXMask, board.mOMask, move))
+                    board.drawEmpty(move)
+                    board.lastMove = lastMove
+            layer = nextLayer
+    return positions
+
+
+"""this function gets the board size, the number of plies and the search time of every position
+    and return dictionary of canonical hash to canonical best move"""
+def buildBook(size, plies, searchTime):
+    TicTac.SEARCH_TIME = searchTime
+    positions = generatePositions(size, plies)
+    print(str(len(positions)) + ' positions to search')
+    game = Game(1, size, 1)
+    if game.mBook is not None:
+        game.mBook.close()
+        game.mBook = None
+    board = game.mBoard
+    moves = {}
+    for count, (xMask, oMask, lastMove) in enumerate(positions.values(), 1):
+        board.setPosition(xMask, oMask, lastMove)
+        move = game.iterativeDeepSearch()
+        key, symmetry = board.getCanonicalHash()
+        moves[key ^ board.mZobristSide] = board.toCanonical(move, symmetry)
+        print(str(count) + '/' + str(len(positions)) + ' depth ' + str(len(game.mSearchStats))
+              + ' move ' + str(move))
+    return moves
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='build the opening book of the TicTac game')
+    parser.add_argument('--size', type=int, default=TicTac.BOARD_SIZE, help='the board size')
+    parser.add_argument('--plies', type=int, default=2, help='the number of rubrics taken in the deepest book position')
+    parser.add_argument('--time', type=float, default=TicTac.SEARCH_TIME, help='the search time of every position in seconds')
+    parser.add_argument('--output', default=None, help='the book file, by default next to TicTac.py')
+    args = parser.parse_args()
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(TicTac.__file__)), BOOK_FILE.format(args.size))
+    start = time.time()
+    book = buildBook(args.size, args.plies, args.time)
+    OpeningBook.write(output, args.size, book)
+    print('wrote ' + str(len(book)) + ' moves to ' + output + ' in ' + str(round(time.time() - start, 1)) + ' seconds')
@@ -0,0 +1,86 @@
+"""
+Benchmark of the timer engines of timers.py, the heap Scheduler and the TimingWheel
+for every engine it inserts a number of far timers and cancels a part of them, fires a burst of timers due
+at the same moment and then timers spread over a few seconds, and reports the inserts, cancels and fires per second
+(the burst) and how late the spread timers fired (p50, p99, max),
+the report is also written as JSON (benchmark_report.py) so runs can be compared between commits
+usage: python timer_benchmark.py --timers 1000000 --fire 100000 --output timers.json
+"""
+import argparse
+import random
+import time
+
+from benchmark_report import addReportArguments, newReport, percentile, writeReport
+from timers import Scheduler, TimingWheel
+
+ENGINES = {'heap': Scheduler, 'wheel': TimingWheel}
+
+
+"""Wait until the condition function is true or the monotonic deadline passed."""
+def waitFor(condition, deadline):
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+"""Run the benchmark on a new engine of the class, return the report of the engine."""
+def benchmarkEngine(engineClass, args):
+    generator = random.Random(args.seed)
+    engine = engineClass()
+    delays = [args.horizon * (1 + generator.random()) for _ in range(args.timers)]
+    start = time.perf_counter()
+    calls = [engine.callLater(delay, None) for delay in delays]
+    insertTime = time.perf_counter() - start
+    cancelled = generator.sample(calls, int(len(calls) * args.cancel))
+    start = time.perf_counter()
+    for call in cancelled:
+        engine.cancel(call)
+    cancelTime = time.perf_counter() - start
+
+    burst = []
+    burstDue = time.monotonic() + 1
+    for _ in range(args.fire):
+        engine.callAt(burstDue, burst.append, None)
+    waitFor(lambda: len(burst) == args.fire, burstDue + 60)
+    fireTime = time.monotonic() - burstDue
+
+    late = []
+    for _ in range(args.spread_timers):
+        due = time.monotonic() + 0.1 + args.spread * generator.random()
+        engine.callAt(due, lambda due: late.append(time.monotonic() - due), due)
+    waitFor(lambda: len(late) == args.spread_timers, time.monotonic() + args.spread + 60)
+    engine.stop()
+    return {'engine': engineClass.__name__,
+            'timers': args.timers,
+            'insertsPerSecond': args.timers / insertTime if insertTime > 0 else 0,
+            'cancelsPerSecond': len(cancelled) / cancelTime if cancelTime > 0 else 0,
+            'fired': len(burst),
+            'firesPerSecond': len(burst) / fireTime if fireTime > 0 else 0,
+            'lateMs': {'p50': percentile(late, 50) * 1000,
+                       'p99': percentile(late, 99) * 1000,
+                       'max': max(late, default=0) * 1000},
+            'early': sum(1 for value in late if value < 0)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the timer engines')
+    parser.add_argument('--engines', nargs='+', default=sorted(ENGINES), choices=sorted(ENGINES),
+                        help='the engines to benchmark')
+    parser.add_argument('--timers', type=int, default=1000000, help='the number of far timers to insert')
+    parser.add_argument('--cancel', type=float, default=0.5, help='the part of the far timers to cancel')
+    parser.add_argument('--horizon', type=float, default=3600, help='the far timers are due in 1-2 horizons (seconds)')
+    parser.add_argument('--fire', type=int, default=100000, help='the number of timers fired together')
+    parser.add_argument('--spread-timers', type=int, default=10000, help='the number of timers spread over time')
+    parser.add_argument('--spread', type=float, default=2, help='the spread timers are due within these seconds')
+    addReportArguments(parser)
+    args = parser.parse_args()
+
+    report = newReport(args)
+    report['engines'] = []
+    for name in args.engines:
+        engineReport = benchmarkEngine(ENGINES[name], args)
+        report['engines'].append(engineReport)
+        print(name + ': ' + str(round(engineReport['insertsPerSecond'])) + ' inserts/sec, '
+              + str(round(engineReport['cancelsPerSecond'])) + ' cancels/sec, '
+              + str(round(engineReport['firesPerSecond'])) + ' fires/sec, late p50/p99/max '
+              + '/'.join(str(round(engineReport['lateMs'][key], 2)) for key in ('p50', 'p99', 'max')) + ' ms')
+    writeReport(report, args.output)
@@ -0,0 +1,496 @@
+"""
+Timers of the to-do app: alarms, countdowns, recurring reminders, to-do due dates and stopwatches
+Scheduler is one thread with a heap of due times, it sleeps on a Condition until the earliest one
+(or until an earlier one is added), so it uses no CPU while it waits and fires within about a millisecond
+TimingWheel does the same with a hierarchical timing wheel, insert and cancel are O(1) whatever the number
+of pending calls, it is the engine of TimerService (timer_benchmark.py compares the two)
+TimerService keeps the alarms and countdowns in the scheduler and a saver thread writes the pending ones
+to a JSON file (at most every SAVE_DELAY seconds, never on the scheduler thread), so they survive restarts,
+an alarm missed while the app was closed fires as soon as the app starts
+stopwatches are only start times, they cost nothing until they are read
+"""
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+import traceback
+
+TIMERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timers.json')
+SAVE_DELAY = 0.2
+WHEEL_RESOLUTION = 0.001
+WHEEL_BITS = 8
+WHEEL_LEVELS = 5
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+"""A call of the scheduler, cancel it with the cancel of the engine which returned it.
+There may be millions of them, __slots__ keeps every one small."""
+class ScheduledCall:
+    __slots__ = ('due', 'callback', 'args', 'cancelled', 'tick', 'slot')
+
+    def __init__(self, due, callback, args):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+"""Calls functions at times of the monotonic clock on its own thread.
+Cancelled calls stay in the heap until they are due or until they are half of it, then the heap is rebuilt.
+The callbacks run on the scheduler thread one after the other, so they must be short."""
+class Scheduler:
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.counter = itertools.count()
+        self.cancelled = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name='scheduler', daemon=True)
+        self.thread.start()
+
+    """Call callback(*args) when the clock reaches due, return the ScheduledCall."""
+    def callAt(self, due, callback, *args):
+        call = ScheduledCall(due, callback, args)
+        with self.condition:
+            heapq.heappush(self.heap, (due, next(self.counter), call))
+            # only a new earliest call changes how long the thread sleeps
+            if self.heap[0][2] is call:
+                self.condition.notify()
+        return call
+
+    def callLater(self, delay, callback, *args):
+        return self.callAt(self.clock() + delay, callback, *args)
+
+    def cancel(self, call):
+        with self.condition:
+            if call.cancelled:
+                return
+            call.cancelled = True
+            self.cancelled += 1
+            if self.cancelled * 2 > len(self.heap):
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.heap or self.heap[0][0] > self.clock()):
+                    self.condition.wait(self.heap[0][0] - self.clock() if self.heap else None)
+                if self.stopped:
+                    return
+                now = self.clock()
+                due = []
+                while self.heap and self.heap[0][0] <= now:
+                    call = heapq.heappop(self.heap)[2]
+                    if call.cancelled:
+                        self.cancelled -= 1
+                    else:
+                        call.cancelled = True
+                        due.append(call)
+            for call in due:
+                try:
+                    call.callback(*call.args)
+                except Exception:
+                    traceback.print_exc()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+
+"""Calls functions at times of the monotonic clock on its own thread, like Scheduler.
+Time is counted in ticks of resolution seconds. There are levels wheels of 2**bits slots, a slot of level k
+holds the calls whose tick differs from the current tick first at digit k (a digit is bits bits of the tick),
+so a call is put in its slot or taken out of it (a dict) in O(1). When the current tick reaches a slot
+of a level above 0 its calls are moved down (cascaded), every call moves at most levels times.
+The thread sleeps until the next non empty slot, a call due after all the levels (about 34 years
+with the defaults) waits in an overflow slot."""
+class TimingWheel:
+
+    def __init__(self, clock=time.monotonic, resolution=WHEEL_RESOLUTION, bits=WHEEL_BITS, levels=WHEEL_LEVELS):
+        self.clock = clock
+        self.resolution = resolution
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = levels
+        self.origin = clock()
+        self.current = 0
+        self.wheels = [[{} for _ in range(1 << bits)] for _ in range(levels)]
+        self.overflow = {}
+        self.ready = {}
+        self.count = 0
+        self.wakeTick = math.inf
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name='timing-wheel', daemon=True)
+        self.thread.start()
+
+    def tickNow(self):
+        return math.floor((self.clock() - self.origin) / self.resolution)
+
+    """Put the call in its slot, the caller holds the condition."""
+    def place(self, call):
+        if call.tick <= self.current:
+            slot = self.ready
+        elif (call.tick ^ self.current) >> (self.bits * self.levels):
+            slot = self.overflow
+        else:
+            level = ((call.tick ^ self.current).bit_length() - 1) // self.bits
+            slot = self.wheels[level][(call.tick >> (self.bits * level)) & self.mask]
+        slot[call] = None
+        call.slot = slot
+
+    """Call callback(*args) when the clock reaches due, return the ScheduledCall."""
+    def callAt(self, due, callback, *args):
+        call = ScheduledCall(due, callback, args)
+        # rounded up, a call never fires early
+        call.tick = math.ceil((due - self.origin) / self.resolution)
+        with self.condition:
+            if not self.count:
+                # nothing is pending, the current tick can jump to now without cascading
+                self.current = max(self.current, self.tickNow())
+            self.place(call)
+            self.count += 1
+            if call.tick < self.wakeTick:
+                self.condition.notify()
+        return call
+
+    def callLater(self, delay, callback, *args):
+        return self.callAt(self.clock() + delay, callback, *args)
+
+    def cancel(self, call):
+        with self.condition:
+            if call.cancelled:
+                return
+            call.cancelled = True
+            del call.slot[call]
+            self.count -= 1
+
+    def __len__(self):
+        return self.count
+
+    """The next tick something happens at (a slot fires or cascades), None if nothing is pending."""
+    def nextTick(self):
+        if self.ready:
+            return self.current
+        for level in range(self.levels):
+            shift = self.bits * level
+            digit = (self.current >> shift) & self.mask
+            wheel = self.wheels[level]
+            # the slots after the current one, the next level cascades before this one wraps
+            for index in range(digit + 1, self.mask + 1):
+                if wheel[index]:
+                    return ((self.current >> shift) - digit + index) << shift
+        if self.overflow:
+            shift = self.bits * self.levels
+            return ((self.current >> shift) + 1) << shift
+        return None
+
+    """Move the current tick to target, cascading and firing the slots on the way,
+    return the calls which are due. The caller holds the condition."""
+    def advance(self, target):
+        due = list(self.ready)
+        self.ready.clear()
+        while True:
+            nextTick = self.nextTick()
+            if nextTick is None or nextTick > target:
+                self.current = max(self.current, target)
+                break
+            self.current = nextTick
+            if not self.current & ((1 << (self.bits * self.levels)) - 1):
+                calls = list(self.overflow)
+                self.overflow.clear()
+                for call in calls:
+                    self.place(call)
+            for level in range(self.levels - 1, 0, -1):
+                if not self.current & ((1 << (self.bits * level)) - 1):
+                    slot = self.wheels[level][(self.current >> (self.bits * level)) & self.mask]
+                    calls = list(slot)
+                    slot.clear()
+                    for call in calls:
+                        self.place(call)
+            slot = self.wheels[0][self.current & self.mask]
+            due.extend(slot)
+            slot.clear()
+            due.extend(self.ready)
+            self.ready.clear()
+        for call in due:
+            call.cancelled = True
+        self.count -= len(due)
+        return due
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopped:
+                        return
+                    nextTick = self.nextTick()
+                    if nextTick is not None and nextTick <= self.tickNow():
+                        break
+                    self.wakeTick = nextTick if nextTick is not None else math.inf
+                    self.condition.wait(None if nextTick is None
+                                        else self.origin + nextTick * self.resolution - self.clock())
+                self.wakeTick = math.inf
+                due = self.advance(self.tickNow())
+            for call in due:
+                try:
+                    call.callback(*call.args)
+                except Exception:
+                    traceback.print_exc()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+
+"""An alarm, a countdown, a recurring reminder or a to-do, due is the wall clock time (seconds since the epoch)
+it fires at next, rule is the recurrence rule of a recurring reminder (see parseRule)."""
+class Timer:
+
+    def __init__(self, timerId, kind, due, label='', rule=None):
+        self.id = timerId
+        self.kind = kind
+        self.due = due
+        self.label = label
+        self.rule = rule
+        self.call = None
+
+    def toJson(self):
+        record = {'id': self.id, 'kind': self.kind, 'due': self.due, 'label': self.label}
+        if self.rule is not None:
+            record['rule'] = self.rule
+        return record
+
+    def __repr__(self):
+        return 'Timer(%d, %s, %s, %r)' % (self.id, self.kind, time.strftime('%H:%M:%S', time.localtime(self.due)),
+                                          self.label)
+
+
+"""The wall clock time of the next hour:minute, today or tomorrow."""
+def nextTime(hour, minute, now=None):
+    now = time.time() if now is None else now
+    local = time.localtime(now)
+    due = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, int(hour), int(minute), 0, 0, 0, -1))
+    if due <= now:
+        due = time.mktime((local.tm_year, local.tm_mon, local.tm_mday + 1, int(hour), int(minute), 0, 0, 0, -1))
+    return due
+
+
+"""Parse a recurrence rule: 'every N minutes', 'every N hours', 'daily HH:MM', 'weekdays HH:MM'
+or 'weekly mon,wed HH:MM', return it as a dict, raise ValueError if it is not one of them."""
+def parseRule(text, now=None):
+    words = text.lower().split()
+    try:
+        if len(words) == 3 and words[0] == 'every' and words[2].rstrip('s') in ('minute', 'hour'):
+            seconds = int(words[1]) * (60 if words[2].startswith('minute') else 3600)
+            if seconds <= 0:
+                raise ValueError
+            return {'every': seconds, 'start': time.time() if now is None else now}
+        if len(words) == 2 and words[0] in ('daily', 'weekdays'):
+            days = list(range(7)) if words[0] == 'daily' else list(range(5))
+            return {'days': days, 'at': parseClock(words[1])}
+        if len(words) == 3 and words[0] == 'weekly':
+            return {'days': sorted(WEEKDAYS.index(day[:3]) for day in words[1].split(',')), 'at': parseClock(words[2])}
+    except ValueError:
+        pass
+    raise ValueError('unknown rule ' + repr(text) + ", use 'every N minutes', 'every N hours', 'daily HH:MM', "
+                     "'weekdays HH:MM' or 'weekly mon,wed HH:MM'")
+
+
+def parseClock(text):
+    hour, minute = (int(part) for part in text.split(':'))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError('wrong time ' + text)
+    return [hour, minute]
+
+
+"""The first wall clock time of the rule after the time after."""
+def nextOccurrence(rule, after):
+    if 'every' in rule:
+        return rule['start'] + (math.floor((after - rule['start']) / rule['every']) + 1) * rule['every']
+    local = time.localtime(after)
+    for day in range(8):
+        due = time.mktime((local.tm_year, local.tm_mon, local.tm_mday + day, rule['at'][0], rule['at'][1], 0, 0, 0,
+                           -1))
+        if due > after and time.localtime(due).tm_wday in rule['days']:
+            return due
+    raise ValueError('the rule has no days')
+
+
+"""Alarms, countdowns, recurring reminders, to-do due dates and stopwatches of the app.
+onFire(timer, late) is called on the scheduler thread when a timer fires, late is how many seconds after
+its due time it fired. path is the JSON file of the pending timers, None keeps them only in memory."""
+class TimerService:
+
+    def __init__(self, path=TIMERS_FILE, onFire=None, scheduler=None):
+        self.path = path
+        self.onFire = onFire if onFire is not None else self.printTimer
+        self.scheduler = scheduler if scheduler is not None else TimingWheel()
+        self.lock = threading.RLock()
+        self.timers = {}
+        self.stopwatches = {}
+        self.nextId = 1
+        self.load()
+        self.saveCondition = threading.Condition()
+        self.dirty = False
+        self.closed = False
+        self.saver = threading.Thread(target=self.runSaver, name='timers-saver', daemon=True)
+        self.saver.start()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path) as timersFile:
+            saved = json.load(timersFile)
+        self.nextId = saved.get('nextId', 1)
+        for record in saved.get('timers', []):
+            self.schedule(Timer(record['id'], record['kind'], record['due'], record.get('label', ''), record.get('rule')))
+
+    def requestSave(self):
+        with self.saveCondition:
+            self.dirty = True
+            self.saveCondition.notify()
+
+    def runSaver(self):
+        while True:
+            with self.saveCondition:
+                while not self.dirty and not self.closed:
+                    self.saveCondition.wait()
+                if self.closed:
+                    return
+            # the changes of the next SAVE_DELAY seconds go to the same write
+            time.sleep(SAVE_DELAY)
+            with self.saveCondition:
+                self.dirty = False
+            self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            data = {'nextId': self.nextId, 'timers': [timer.toJson() for timer in self.pending()]}
+        # written to a temporary file and renamed, a crash never leaves half a file
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as timersFile:
+            json.dump(data, timersFile)
+        os.replace(temporary, self.path)
+
+    def schedule(self, timer):
+        with self.lock:
+            self.timers[timer.id] = timer
+            # the scheduler runs on the monotonic clock, the wall clock due time is converted once
+            timer.call = self.scheduler.callLater(max(0.0, timer.due - time.time()), self.fire, timer)
+
+    def add(self, kind, due, label='', rule=None):
+        with self.lock:
+            timer = Timer(self.nextId, kind, due, label, rule)
+            self.nextId += 1
+            self.schedule(timer)
+        self.requestSave()
+        return timer
+
+    """Add an alarm at the next hour:minute, return the Timer."""
+    def addAlarm(self, hour, minute, label=''):
+        return self.add('alarm', nextTime(hour, minute), label)
+
+    """Add a countdown of seconds from now, return the Timer."""
+    def addCountdown(self, seconds, label=''):
+        return self.add('countdown', time.time() + float(seconds), label)
+
+    """Add a reminder repeating by the rule (see parseRule), return the Timer."""
+    def addRecurring(self, ruleText, label=''):
+        rule = parseRule(ruleText)
+        return self.add('recurring', nextOccurrence(rule, time.time()), label, rule)
+
+    """Add a to-do which reminds of itself at due (wall clock seconds), return the Timer."""
+    def addTodo(self, text, due):
+        return self.add('todo', due, text)
+
+    """Cancel the pending timer, return True if there was one."""
+    def cancel(self, timerId):
+        with self.lock:
+            timer = self.timers.pop(timerId, None)
+            if timer is None:
+                return False
+            self.scheduler.cancel(timer.call)
+        self.requestSave()
+        return True
+
+    """The pending timers (of the kind), the earliest first."""
+    def pending(self, kind=None):
+        with self.lock:
+            return sorted((timer for timer in self.timers.values() if kind is None or timer.kind == kind),
+                          key=lambda timer: (timer.due, timer.id))
+
+    def fire(self, timer):
+        late = time.time() - timer.due
+        with self.lock:
+            if self.timers.pop(timer.id, None) is None:
+                return
+            if timer.rule is not None:
+                # occurrences missed while the app was closed fire once, then the rule goes on from now
+                fired = Timer(timer.id, timer.kind, timer.due, timer.label, timer.rule)
+                timer.due = nextOccurrence(timer.rule, max(time.time(), timer.due))
+                self.schedule(timer)
+                timer = fired
+        self.requestSave()
+        self.onFire(timer, late)
+
+    @staticmethod
+    def describeTimer(timer, late=0):
+        return (timer.kind.upper() + ' ' + time.strftime('%H:%M:%S', time.localtime(timer.due))
+                + (' ' + timer.label if timer.label else '') + (' (late ' + str(round(late)) + ' s)' if late >= 1 else ''))
+
+    @staticmethod
+    def printTimer(timer, late):
+        print('\n' + TimerService.describeTimer(timer, late))
+
+    """Start a stopwatch, return its id."""
+    def startStopwatch(self, label=''):
+        with self.lock:
+            stopwatchId = self.nextId
+            self.nextId += 1
+            self.stopwatches[stopwatchId] = (label, time.monotonic())
+        return stopwatchId
+
+    """Return the seconds since the stopwatch started, None if there is no such stopwatch."""
+    def readStopwatch(self, stopwatchId):
+        with self.lock:
+            if stopwatchId not in self.stopwatches:
+                return None
+            return time.monotonic() - self.stopwatches[stopwatchId][1]
+
+    """Stop the stopwatch, return its seconds or None if there is no such stopwatch."""
+    def stopStopwatch(self, stopwatchId):
+        with self.lock:
+            elapsed = self.readStopwatch(stopwatchId)
+            self.stopwatches.pop(stopwatchId, None)
+        return elapsed
+
+    """Return (id, label, seconds) of the running stopwatches."""
+    def runningStopwatches(self):
+        with self.lock:
+            now = time.monotonic()
+            return [(stopwatchId, label, now - start) for stopwatchId, (label, start) in sorted(self.stopwatches.items())]
+
+    def close(self):
+        self.scheduler.stop()
+        with self.saveCondition:
+            self.closed = True
+            self.saveCondition.notify()
+        self.saver.join()
+        self.save()
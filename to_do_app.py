@@ -1,11 +1,20 @@
-import time,datetime,os
-from googlesearch import search
+import time
 from selenium import webdriver
 import requests
 import math
 import wikipedia
 from googletrans import Translator
 import calendar as cal
+from contact_store import DIRECTORY_FILE, SEARCH_LIMIT, PAGE_SIZE
+from directory_service import DirectoryService
+import contact_io
+from timers import TimerService
+from notifications import Notification, NotificationDispatcher, defaultSinks
+from http_client import sharedClient
+from weather import fetchWeatherBatch, WeatherReport
+from news_store import NewsStore, NewsFeed, NEWS_LIMIT
+from web_search import SearchService, GoogleBackend, SEARCH_RESULTS
+from wiki_cache import WikiLookup
 
 a = str("FOR OPERATORS ENTER THE FOLLOWING you can use upper or lower case for operations\n"
                 "+     for addition\n"
@@ -59,108 +68,287 @@ b = str('Language Name	Code	Language Name	Language Code\n'
 'Indonesian	id	Yiddish	yi\n')
 NO_OF_PLAYERS = 1
 BOARD_SIZE = 5
+NAME_WIDTH = 30
+NUMBER_WIDTH = 16
 print('****************************  Utilities ***********************')
+def formatColumns(name,number,nameWidth=NAME_WIDTH,numberWidth=NUMBER_WIDTH):
+    # names longer than the column are cut so the numbers stay aligned
+    name = str(name)
+    if len(name) > nameWidth:
+        name = name[:nameWidth-3]+'...'
+    return name.ljust(nameWidth)+' '+str(number).rjust(numberWidth)
+
 class TelephoneDirectory:
-    def __init__(self):
-        self.list1 = []
-        self.list2 = []
-        self.dict1 = {}
+    def __init__(self,directory=None,timers=None,notifications=None,http=None,webSearch=None,wiki=None,
+                 newsStore=None,newsFeed=None):
+        # the menu is a client of the same DirectoryService the HTTP service (directory_service.py) runs,
+        # contacts live in its SQLite file, not in memory
+        self.directory = directory if directory is not None else DirectoryService(DIRECTORY_FILE)
+        # the timer thread only queues notifications, sounds and desktop popups are sent on the dispatcher thread
+        self.notifications = notifications if notifications is not None else NotificationDispatcher(defaultSinks())
+        # alarms, countdowns and stopwatches run on the timer thread, the menu is never blocked
+        self.timers = timers if timers is not None else TimerService(onFire=self.timerFired)
+        # weather and news share one pooled, cached HTTP client
+        self.http = http if http is not None else sharedClient()
+        # the news is polled into news.db on the timer engine, reading it costs no request,
+        # without a news API key the polls start only when the news are asked for
+        self.newsStore = newsStore if newsStore is not None else NewsStore()
+        self.newsFeed = newsFeed if newsFeed is not None else NewsFeed(self.newsStore, client=self.http)
+        if self.newsFeed.hasKey():
+            self.newsFeed.start(self.timers.scheduler)
+        # the result pages are fetched together and cached for an hour, the Google backend needs the googlesearch
+        # package, it is made by the first search
+        self.webSearch = webSearch
+        # Wikipedia pages come from wiki.db, a dump indexed with wiki_cache.py or online, in this order
+        self.wiki = wiki if wiki is not None else WikiLookup()
         self.temp = 100
 
     def addContact(self,name,number):
-        self.list1.extend(name)
-        self.list2.extend(number)
-        self.dict1[name]=number
+        # numbers are saved in E.164 form, so the same number typed differently is found as a duplicate
+        try:
+            others = [other for other in self.directory.namesOfNumber(number) if other != name]
+            self.directory.add(name, number)
+        except ValueError:
+            print('Invalid number '+str(number))
+            return
+        if others:
+            print('This number is also saved as '+', '.join(others))
         print('Successfully added')
 
-    def searchContact(self,name):
-        for k,v in self.dict1.items():
-            if name == k:
-                print(str(k)+':'+str(self.dict1[name]))
-                return
-            else:
-                print('No name exist in dictionary')
-                return
+    def searchContact(self,name,limit=SEARCH_LIMIT):
+        # exact name first, than names starting with it, than similar names (typos)
+        match, found = self.directory.search(name, limit)
+        if match is None:
+            print('No name exist in dictionary')
+            return
+        if match == 'fuzzy':
+            print('Did you mean')
+        for k,v in found:
+            print(str(k)+':'+str(v))
+        return
+
+    def searchNumber(self,number,limit=SEARCH_LIMIT):
+        # the full number or its last digits
+        found = False
+        for k,v in self.directory.searchNumber(number, limit):
+            found = True
+            print(str(k)+':'+str(v))
+        if not found:
+            print('No contact with this number')
+        return
 
     def deleteContact(self,name):
-        #self.list1.remove(name)
-        #self.list2.remove(self.dict1[name])
-        del self.dict1[name]
-        print(self.dict1)
+        # only the changed contact is printed, the change is in the journal (contact history)
+        if not self.directory.delete(name):
+            print('No name exist in dictionary')
+            return
+        print('Deleted '+str(name))
         return
 
     def updateContact(self,name,value):
-        self.dict1[name] = value
-        print(self.dict1)
+        try:
+            self.directory.update(name, value)
+        except ValueError:
+            print('Invalid number '+str(value))
+            return
+        print(str(name)+':'+str(self.directory.get(name)))
+        return
+
+    def contactHistory(self,name):
+        changes = self.directory.history(name)
+        if not changes:
+            print('No changes of '+str(name))
+        for seq,changed,operation,number in changes:
+            print(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(changed))+' '+operation+' '
+                  +(str(number) if number is not None else ''))
         return
 
-    def viewContact(self):
-        print(self.dict1)
+    def duplicateNumbers(self,limit=SEARCH_LIMIT):
+        found = False
+        for number,names in self.directory.findDuplicates(limit):
+            found = True
+            print(str(number)+': '+', '.join(names))
+        if not found:
+            print('No number is saved twice')
         return
 
+    def viewContact(self,pageSize=PAGE_SIZE,nameWidth=NAME_WIDTH,numberWidth=NUMBER_WIDTH):
+        # one page at a time in name order, the next page is read from the store only when it is asked for
+        total = None
+        shown = 0
+        print(formatColumns('Name','Number',nameWidth,numberWidth))
+        print('-'*(nameWidth+numberWidth+1))
+        for page in self.directory.iterPages(pageSize):
+            for k,v in page:
+                print(formatColumns(k,v,nameWidth,numberWidth))
+            shown += len(page)
+            if total is None:
+                total = self.directory.count()
+            if shown >= total:
+                break
+            if input('-- '+str(shown)+' of '+str(total)+', Enter for next page, q to stop --\n').strip().lower() == 'q':
+                break
+        if not shown:
+            print('Directory is empty')
+        return
+
+    def importContacts(self,path):
+        # CSV, vCard (.vcf) or JSON Lines, chosen by the file extension
+        def progress(report):
+            print(str(report['read'])+' read, '+str(report['added'])+' added ('+str(int(report['rowsPerSecond']))+' rows/sec)')
+        try:
+            report = self.directory.importContacts(path, progress=progress)
+        except (OSError, ValueError) as error:
+            print('Cannot import '+path+': '+str(error))
+            return
+        print('Imported '+str(report['added'])+' contacts, '+str(report['duplicates'])+' duplicates, '
+              +str(report['invalid'])+' invalid in '+str(round(report['seconds'],2))+' seconds ('
+              +str(int(report['rowsPerSecond']))+' rows/sec)')
+
+    def exportContacts(self,path):
+        try:
+            report = contact_io.exportContacts(path, self.directory)
+        except (OSError, ValueError) as error:
+            print('Cannot export to '+path+': '+str(error))
+            return
+        print('Exported '+str(report['written'])+' contacts in '+str(round(report['seconds'],2))+' seconds ('
+              +str(int(report['rowsPerSecond']))+' rows/sec)')
+
     def stopwatch(self,value):
-       secs = input('Enter seconds')
-       print(str(time.ctime())[0:10]+str(time.ctime())[19:24])
-       then = datetime.datetime.now() + datetime.timedelta(seconds=float(secs))
-       while then > datetime.datetime.now():
-           print(str(time.ctime())[10:-5])
-           time.sleep(1)
+       secs = input('Enter seconds for a countdown, or press Enter to start/stop the stopwatch\n').strip()
+       if secs:
+           try:
+               timer = self.timers.addCountdown(float(secs))
+           except ValueError:
+               print('Wrong seconds '+secs)
+               return
+           print('Countdown ends at '+time.strftime('%H:%M:%S', time.localtime(timer.due)))
+           return
+       running = self.timers.runningStopwatches()
+       if running:
+           print('Stopwatch: '+str(round(self.timers.stopStopwatch(running[-1][0]),2))+' seconds')
+       else:
+           self.timers.startStopwatch()
+           print('Stopwatch started at '+str(time.ctime())[10:-5]+', choose Stopwatch again to stop it')
+
+    def timerFired(self,timer,late):
+        self.notifications.notify(Notification(TimerService.describeTimer(timer, late), kind=timer.kind))
+
+    def addReminder(self,rule,label):
+        # 'every N minutes', 'every N hours', 'daily HH:MM', 'weekdays HH:MM', 'weekly mon,wed HH:MM'
+        try:
+            timer = self.timers.addRecurring(rule, label)
+        except ValueError as error:
+            print(str(error))
+            return
+        print('Reminder set, next at '+time.strftime('%Y-%m-%d %H:%M', time.localtime(timer.due)))
+
+    def addTodo(self,text,due):
+        try:
+            dueTime = time.mktime(time.strptime(due.strip(), '%Y-%m-%d %H:%M'))
+        except ValueError:
+            print('Wrong date '+due+', use YYYY-MM-DD HH:MM')
+            return
+        timer = self.timers.addTodo(text, dueTime)
+        print('To-do '+str(timer.id)+' due '+time.strftime('%Y-%m-%d %H:%M', time.localtime(timer.due)))
+
+    def todoList(self):
+        todos = self.timers.pending('todo')
+        for timer in todos:
+            print(str(timer.id)+': '+time.strftime('%Y-%m-%d %H:%M', time.localtime(timer.due))+' '+timer.label)
+        if not todos:
+            print('No to-dos')
+
+    def showTimers(self):
+        pending = self.timers.pending()
+        for timer in pending:
+            print(str(timer.id)+': '+timer.kind+' at '+time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timer.due))
+                  +(' '+timer.label if timer.label else ''))
+        for stopwatchId,label,seconds in self.timers.runningStopwatches():
+            print(str(stopwatchId)+': stopwatch running for '+str(round(seconds,2))+' seconds')
+        if not pending and not self.timers.runningStopwatches():
+            print('No timers')
 
-    def weather(self,city):
-        api_key = 'Your API Key Here'
-        base_url = "http://api.openweathermap.org/data/2.5/weather?"
-        city_name = city
-        complete_url = base_url + "appid=" + api_key + "&q=" + city_name
-        response = requests.get(complete_url)
-        x = response.json()
-        if x["cod"] != "404":
-            y = x["main"]
-            current_temperature = y["temp"]
-            current_temperature -= 273
-            current_pressure = y["pressure"]
-            current_humidiy = y["humidity"]
-            z = x["weather"]
-            weather_description = z[0]["description"]
-            print(" Temperature (in celsius unit) = " +
-                  str(current_temperature) +
-                  "\n atmospheric pressure (in hPa unit) = " +
-                  str(current_pressure) +
-                  "\n humidity (in percentage) = " +
-                  str(current_humidiy) +
-                  "\n description = " +
-                  str(weather_description))
+    def cancelTimer(self,timerId):
+        if timerId.isdigit() and self.timers.cancel(int(timerId)):
+            print('Cancelled timer '+timerId)
+        elif timerId.isdigit() and self.timers.stopStopwatch(int(timerId)) is not None:
+            print('Stopped stopwatch '+timerId)
         else:
-            print(" City Not Found ")
+            print('No timer '+timerId)
+
+    def weather(self,cities):
+        # one city or many separated by commas, they are asked at the same time
+        for city,result in fetchWeatherBatch(cities.split(','), self.http).items():
+            if isinstance(result, WeatherReport):
+                print(" "+result.name+
+                      "\n Temperature (in celsius unit) = " +
+                      str(result.temperature) +
+                      "\n atmospheric pressure (in hPa unit) = " +
+                      str(result.pressure) +
+                      "\n humidity (in percentage) = " +
+                      str(result.humidity) +
+                      "\n description = " +
+                      str(result.description))
+            elif result.status == 404:
+                print(" "+city.strip()+": City Not Found ")
+            else:
+                print(" "+city.strip()+": Cannot get the weather: "+result.message)
 
     def alarm(self,hour,minute):
-        stop = False
-        time1_hour = hour
-        time1_min = minute
-        if len(time1_hour) == 1:
-            time1_hour = '0' + time1_hour
-        while stop == False:
-            rn = str(datetime.datetime.now().time())
-            print(rn)
-            if rn >= time1_hour + ":" + time1_min + ":00.000000":
-                stop = True
-                os.system("1.mp3")
+        # the alarm is kept in timers.json, it rings even if the app was restarted before it
+        if not (hour.strip().isdigit() and minute.strip().isdigit() and int(hour) < 24 and int(minute) < 60):
+            print('Wrong time '+hour+':'+minute)
+            return
+        timer = self.timers.addAlarm(int(hour), int(minute))
+        print('Alarm set for '+time.strftime('%Y-%m-%d %H:%M', time.localtime(timer.due)))
 
     def news(self):
-        main_url = 'https://newsapi.org/v1/articles?source=bbc-news&sortBy=top&apiKey="YOUR NEWS API KEY HERE";'
-        open_bbc_page = requests.get(main_url).json()
-        article = open_bbc_page['articles']
-        result = []
-        for ar in article:
-            result.append(ar['title'])
+        result = self.newsStore.latest(limit=NEWS_LIMIT)
+        if not result:
+            # the first run, before the first poll has ended
+            for source,error in self.newsFeed.pollAll().items():
+                if isinstance(error, Exception):
+                    print('Cannot get the news of '+source+': '+str(error))
+            result = self.newsStore.latest(limit=NEWS_LIMIT)
+        if not self.newsFeed.started():
+            self.newsFeed.start(self.timers.scheduler)
+        for i in range(len(result)):
+            print(i + 1, result[i].title)
+
+    def searchNews(self,keyword):
+        result = self.newsStore.search(keyword)
+        if not result:
+            print('No news about '+keyword)
         for i in range(len(result)):
-            print(i + 1, result[i])
+            print(i + 1, result[i].title)
+            print('   '+result[i].url)
 
     def googlesearch(self,keyword):
-        for j in search(keyword,stop=20):
-            print(j)
+        # the URLs are printed as their pages arrive
+        if self.webSearch is None:
+            try:
+                self.webSearch = SearchService(GoogleBackend())
+            except RuntimeError as error:
+                print('Search failed: '+str(error))
+                return
+        try:
+            for j in self.webSearch.search(keyword,SEARCH_RESULTS):
+                print(j)
+        except OSError as error:
+            # urllib errors, like 429 when Google limits the client
+            print('Search failed: '+str(error))
 
     def wikipediasearch(self,keyword):
-        complete_content = wikipedia.page(keyword)
+        try:
+            complete_content = self.wiki.page(keyword)
+        except (wikipedia.exceptions.WikipediaException, requests.RequestException) as error:
+            print(str(error))
+            return
+        if complete_content is None:
+            suggestions = self.wiki.suggest(keyword)
+            print('No page about '+keyword+(', did you mean: '+', '.join(suggestions) if suggestions else ''))
+            return
         print(complete_content.content)
 
     def scientificCalculator(self):
@@ -276,6 +464,17 @@ if __name__=='__main__':
                          14:Language translate
                          15:Tic Tac Game
                          16:Calendar
+                         17:Search by number
+                         18:Import contacts (csv, vcf, jsonl)
+                         19:Export contacts (csv, vcf, jsonl)
+                         20:Duplicate numbers
+                         21:Contact history
+                         22:Timers
+                         23:Cancel a timer
+                         24:Recurring reminder
+                         25:Add a to-do with due date
+                         26:To-do list
+                         27:Search news
                          """)
         choice = input("Enter your choice\n")
         if choice == str(1):
@@ -295,7 +494,8 @@ if __name__=='__main__':
             value = input('Enter value\n')
             object.updateContact(name, value)
         elif choice == str(5):
-            object.viewContact()
+            size = input('Enter contacts per page (Enter for '+str(PAGE_SIZE)+')\n').strip()
+            object.viewContact(int(size) if size.isdigit() and int(size) > 0 else PAGE_SIZE)
         elif choice == str(6):
             start = time.time()
             object.stopwatch(start)
@@ -304,7 +504,7 @@ if __name__=='__main__':
             minute = input('Enter minute')
             object.alarm(hour,minute)
         elif choice == str(8):
-            city = input('Enter city name:  ')
+            city = input('Enter city names (separated by commas):  ')
             object.weather(city)
         elif choice == str(9):
             object.news()
@@ -328,5 +528,37 @@ if __name__=='__main__':
         elif choice == str(16):
             yy = input('Enter year')
             object.calendar(yy)
+        elif choice == str(17):
+            number = input('Enter number or its last digits\n')
+            object.searchNumber(number)
+        elif choice == str(18):
+            path = input('Enter file to import\n')
+            object.importContacts(path)
+        elif choice == str(19):
+            path = input('Enter file to export to\n')
+            object.exportContacts(path)
+        elif choice == str(20):
+            object.duplicateNumbers()
+        elif choice == str(21):
+            name = input('Enter name\n')
+            object.contactHistory(name)
+        elif choice == str(22):
+            object.showTimers()
+        elif choice == str(23):
+            timerId = input('Enter timer number\n').strip()
+            object.cancelTimer(timerId)
+        elif choice == str(24):
+            rule = input('Enter rule (every N minutes, every N hours, daily HH:MM, weekdays HH:MM, weekly mon,wed HH:MM)\n')
+            label = input('Enter reminder text\n')
+            object.addReminder(rule, label)
+        elif choice == str(25):
+            text = input('Enter to-do\n')
+            due = input('Enter due date (YYYY-MM-DD HH:MM)\n')
+            object.addTodo(text, due)
+        elif choice == str(26):
+            object.todoList()
+        elif choice == str(27):
+            keyword = input('Enter words to search in the news titles\n')
+            object.searchNews(keyword)
         else:
             print('Wrong choice, Enter other one\n')
\ No newline at end of file
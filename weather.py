@@ -0,0 +1,78 @@
+"""
+Weather of many cities at once
+fetchWeatherBatch asks the weather of every city at the same time on a bounded thread pool, through the shared
+HTTP client (so the connections are reused and a city asked within WEATHER_TTL comes from the cache),
+a city given twice (in any case) is asked once, and the result of every city is a WeatherReport
+or a WeatherError, one failing city does not fail the others
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+
+from http_client import sharedClient
+
+WEATHER_URL = 'http://api.openweathermap.org/data/2.5/weather'
+WEATHER_KEY = 'Your API Key Here'
+WEATHER_TTL = 600
+WORKERS = 8
+KELVIN = 273.15
+
+
+@dataclass
+class WeatherReport:
+    city: str
+    name: str
+    temperature: float
+    pressure: int
+    humidity: int
+    description: str
+    fromCache: bool = False
+
+
+@dataclass
+class WeatherError:
+    city: str
+    message: str
+    status: int = 0
+
+
+def cityKey(city):
+    # the API does not care about the case of the city, the cache key does
+    return ' '.join(city.split()).lower()
+
+
+"""The WeatherReport of the city, or a WeatherError if it is not found or the service cannot be reached."""
+def fetchWeather(city, client=None, url=WEATHER_URL, key=WEATHER_KEY):
+    client = client if client is not None else sharedClient()
+    try:
+        response = client.get(url, {'appid': key, 'q': cityKey(city)}, ttl=WEATHER_TTL)
+        answer = response.json()
+    except (requests.RequestException, ValueError) as error:
+        return WeatherError(city, str(error))
+    if not isinstance(answer, dict):
+        # a proxy or a broken API can answer valid JSON which is not an object
+        return WeatherError(city, 'unexpected answer, not a JSON object', response.status)
+    if not response.ok or str(answer.get('cod')) != '200':
+        return WeatherError(city, answer.get('message', 'city not found'), response.status)
+    try:
+        return WeatherReport(city, answer.get('name', city), round(answer['main']['temp'] - KELVIN, 2),
+                             answer['main']['pressure'], answer['main']['humidity'],
+                             answer['weather'][0]['description'], response.fromCache)
+    except (KeyError, IndexError, TypeError) as error:
+        return WeatherError(city, 'unexpected answer, missing ' + str(error), response.status)
+
+
+"""A dict of every city (in the order given) to its WeatherReport or WeatherError.
+The distinct cities are asked at the same time on up to workers threads."""
+def fetchWeatherBatch(cities, client=None, workers=WORKERS, url=WEATHER_URL, key=WEATHER_KEY):
+    client = client if client is not None else sharedClient()
+    unique = {}
+    for city in cities:
+        if cityKey(city):
+            unique.setdefault(cityKey(city), city)
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(unique))) as pool:
+        futures = {cityName: pool.submit(fetchWeather, city, client, url, key) for cityName, city in unique.items()}
+    return {city: futures[cityKey(city)].result() for city in cities if cityKey(city)}
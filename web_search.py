@@ -0,0 +1,185 @@
+"""
+Web search of the to-do app
+SearchService asks a backend (GoogleBackend, or FakeBackend to test without the network) for the result pages
+of a query at the same time on a thread pool and streams the URLs as the pages arrive, in the order of the results
+every page is cached for a TTL, so a repeated query, or a longer one which starts with the same pages, comes back
+without a request, and two searches which need the same page at the same time share one request
+every backend has a token bucket which limits its requests per second
+"""
+import abc
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from googlesearch import search as googleSearch
+except ImportError:
+    googleSearch = None
+
+SEARCH_TTL = 3600
+SEARCH_RESULTS = 20
+CACHE_PAGES = 1024
+WORKERS = 4
+
+
+"""The cache key of a query, the case and the spaces between the words do not matter."""
+def queryKey(query):
+    return ' '.join(query.lower().split())
+
+
+"""Allows rate requests per second on average and burst at once, acquire waits for a token."""
+class TokenBucket:
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # the tokens may go below 0, the callers wait in the order they came
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+"""Where the results come from, fetchPage returns the URLs of one page (pageSize results, fewer on the
+last page). rate and burst limit the requests per second of the backend."""
+class SearchBackend(abc.ABC):
+    name = 'backend'
+    pageSize = 10
+    rate = 1.0
+    burst = 1
+
+    """The URLs of the page (counted from 0) of the results of the query."""
+    @abc.abstractmethod
+    def fetchPage(self, query, page):
+        pass
+
+
+"""Google results through the googlesearch package, slowly, Google blocks clients which ask fast."""
+class GoogleBackend(SearchBackend):
+    name = 'google'
+    rate = 0.5
+    burst = 2
+
+    def __init__(self, tld='com', lang='en'):
+        if googleSearch is None:
+            raise RuntimeError('the googlesearch package is not installed')
+        self.tld = tld
+        self.lang = lang
+
+    def fetchPage(self, query, page):
+        # the bucket of the service waits between the requests, not the package (pause=0)
+        start = page * self.pageSize
+        return list(googleSearch(query, tld=self.tld, lang=self.lang, num=self.pageSize, start=start,
+                                 stop=start + self.pageSize, pause=0))
+
+
+"""Made up results (https://example.com/<query>/<n>) to test without the network, every page takes
+delay seconds, a query has total results and calls counts the pages asked."""
+class FakeBackend(SearchBackend):
+    name = 'fake'
+    rate = 1000.0
+    burst = 1000
+
+    def __init__(self, delay=0, total=100):
+        self.delay = delay
+        self.total = total
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def fetchPage(self, query, page):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        slug = '-'.join(query.split())
+        return ['https://example.com/%s/%d' % (slug, number)
+                for number in range(page * self.pageSize, min(self.total, (page + 1) * self.pageSize))]
+
+
+"""Searches the backend, the result pages are cached for ttl seconds (the newest cachePages pages)
+and fetched on up to workers threads."""
+class SearchService:
+
+    def __init__(self, backend, ttl=SEARCH_TTL, cachePages=CACHE_PAGES, workers=WORKERS):
+        self.backend = backend
+        self.ttl = ttl
+        self.cachePages = cachePages
+        self.bucket = TokenBucket(backend.rate, backend.burst)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.cache = OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def cached(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return entry[1]
+
+    def fetch(self, query, page):
+        self.bucket.acquire()
+        return self.backend.fetchPage(query, page)
+
+    """A future of the URLs of the page: a done one from the cache, the one of a running request
+    for the same page, or a new request."""
+    def pageFuture(self, query, page):
+        key = (queryKey(query), page)
+        urls = self.cached(key)
+        if urls is not None:
+            future = Future()
+            future.set_result(urls)
+            return future
+        with self.lock:
+            if key in self.inflight:
+                return self.inflight[key]
+            future = self.pool.submit(self.fetch, query, page)
+            self.inflight[key] = future
+        # outside the lock, a future which is already done calls store at once
+        future.add_done_callback(lambda done: self.store(key, done))
+        return future
+
+    def store(self, key, future):
+        with self.lock:
+            self.inflight.pop(key, None)
+            if future.exception() is None:
+                self.cache[key] = (time.monotonic() + self.ttl, future.result())
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cachePages:
+                    self.cache.popitem(last=False)
+
+    """Yield the first results URLs of the query as their pages arrive, without repeats.
+    The exception of a failed page is raised after the URLs of the pages before it."""
+    def search(self, query, results=SEARCH_RESULTS):
+        if not query.split():
+            return
+        pages = -(-results // self.backend.pageSize)
+        futures = [self.pageFuture(query, page) for page in range(pages)]
+        seen = set()
+        for future in futures:
+            urls = future.result()
+            for url in urls:
+                if url not in seen:
+                    seen.add(url)
+                    yield url
+                    if len(seen) == results:
+                        return
+            if len(urls) < self.backend.pageSize:
+                # the last page of the query, the pages after it are empty
+                return
+
+    def close(self):
+        self.pool.shutdown(wait=False)
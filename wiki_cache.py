@@ -0,0 +1,353 @@
+"""
+Local Wikipedia pages
+WikiLookup finds a page in the page cache first, then in a local Wikipedia dump (if one is indexed) and then online
+(the wikipedia package), every page found is kept zlib compressed in the cache (a SQLite file), so a page looked up
+before costs no network and no dump read
+the dump index maps every title to the byte offset (and length) of its page in the dump file: for the multistream
+.xml.bz2 dumps the offset of the bz2 stream of 100 pages which has it (read from the -multistream-index.txt.bz2 of the
+dump or found by scanning the streams), for an uncompressed .xml dump the offset of the <page> itself, so a lookup
+reads only that part of the file
+usage: python wiki_cache.py index enwiki-latest-pages-articles-multistream.xml.bz2 --index <the index .txt.bz2>
+       python wiki_cache.py lookup "Python (programming language)"
+"""
+import argparse
+import bz2
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+import zlib
+
+try:
+    import wikipedia
+except ImportError:
+    wikipedia = None
+
+WIKI_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wiki.db')
+WIKI_TTL = 7 * 24 * 3600
+CACHE_PAGES = 5000
+INDEX_CHUNK = 10000
+READ_BLOCK = 1 << 16
+REDIRECTS = 3
+
+SCHEMA = ['CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, title TEXT NOT NULL, url TEXT, '
+          'content BLOB NOT NULL, source TEXT NOT NULL, fetched REAL NOT NULL)',
+          'CREATE INDEX IF NOT EXISTS pages_fetched ON pages (fetched)',
+          # titles which differ only in case ("Aids" and "AIDS") are different pages, the key finds them all
+          'CREATE TABLE IF NOT EXISTS dump_titles (title TEXT PRIMARY KEY, key TEXT NOT NULL, '
+          'offset INTEGER NOT NULL, length INTEGER NOT NULL) WITHOUT ROWID',
+          'CREATE INDEX IF NOT EXISTS dump_titles_key ON dump_titles (key)',
+          'CREATE TABLE IF NOT EXISTS dump_meta (key TEXT PRIMARY KEY, value)']
+
+
+"""The title the way Wikipedia writes it: spaces for underscores, no repeated spaces and the first letter
+upper case (the only letter whose case does not matter)."""
+def titleText(title):
+    text = ' '.join(title.replace('_', ' ').split())
+    return text[:1].upper() + text[1:]
+
+
+"""The lookup key of a title, the case of every letter does not matter."""
+def titleKey(title):
+    return titleText(title).casefold()
+
+
+def prefixEnd(prefix):
+    # the smallest string after every string which starts with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+TEMPLATE = re.compile(r'\{\{[^{}]*\}\}')
+MARKUP = [(re.compile(r'<!--.*?-->', re.S), ''),
+          (re.compile(r'<ref[^>/]*/>'), ''),
+          (re.compile(r'<ref[^>]*>.*?</ref>', re.S), ''),
+          (re.compile(r'\{\|.*?\|\}', re.S), ''),
+          (re.compile(r'\[\[(?:File|Image|Category):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]', re.I), ''),
+          (re.compile(r'\[\[[^\]|]*\|([^\]]*)\]\]'), r'\1'),
+          (re.compile(r'\[\[([^\]]*)\]\]'), r'\1'),
+          (re.compile(r'\[https?://\S+ ([^\]]*)\]'), r'\1'),
+          (re.compile(r"'{2,}"), ''),
+          (re.compile(r'<[^>]+>'), ''),
+          (re.compile(r'^(=+)\s*(.*?)\s*\1\s*$', re.M), r'\n\2\n'),
+          (re.compile(r'\n{3,}'), '\n\n')]
+
+
+"""The readable text of the wiki markup of a dump page: no templates, references, tables or links markup."""
+def plainText(wikitext):
+    text = wikitext
+    while True:
+        stripped = TEMPLATE.sub('', text)
+        if stripped == text:
+            break
+        text = stripped
+    for pattern, replacement in MARKUP:
+        text = pattern.sub(replacement, text)
+    return html.unescape(text).strip()
+
+
+"""A page, source tells where it came from: 'cache', 'dump' or 'online'."""
+class WikiPage:
+
+    def __init__(self, title, content, url=None, source='online'):
+        self.title = title
+        self.content = content
+        self.url = url
+        self.source = source
+
+    def __repr__(self):
+        return 'WikiPage(%r, %s, %d chars)' % (self.title, self.source, len(self.content))
+
+
+"""Yield (title, redirect title or None, wikitext) of every <page> of a part of a dump."""
+def pagesOf(text):
+    start = text.find('<page>')
+    while start >= 0:
+        end = text.find('</page>', start)
+        if end < 0:
+            return
+        page = ElementTree.fromstring(text[start:end + len('</page>')])
+        redirect = page.find('redirect')
+        yield (page.findtext('title', ''), redirect.get('title') if redirect is not None else None,
+               page.findtext('revision/text', ''))
+        start = text.find('<page>', end)
+
+
+"""The compressed page cache and the dump index in a SQLite file, pages older than ttl are asked again
+and only the newest cachePages pages are kept."""
+class WikiCache:
+
+    def __init__(self, path=WIKI_FILE, ttl=WIKI_TTL, cachePages=CACHE_PAGES):
+        self.ttl = ttl
+        self.cachePages = cachePages
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.lock = threading.Lock()
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def getPage(self, title):
+        with self.lock:
+            row = self.connection.execute('SELECT title, url, content, fetched FROM pages WHERE key = ?',
+                                          (titleText(title),)).fetchone()
+        if row is None or row[3] + self.ttl <= time.time():
+            return None
+        return WikiPage(row[0], zlib.decompress(row[2]).decode('utf-8'), row[1], 'cache')
+
+    """Keep the page under its title and the other titles (the title it was asked by)."""
+    def putPage(self, page, *titles):
+        content = zlib.compress(page.content.encode('utf-8'), 6)
+        keys = {titleText(title) for title in (page.title,) + titles}
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO pages (key, title, url, content, source, fetched) '
+                                        'VALUES (?, ?, ?, ?, ?, ?)',
+                                        [(key, page.title, page.url, content, page.source, time.time())
+                                         for key in keys])
+            extra = self.connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0] - self.cachePages
+            if extra > 0:
+                self.connection.execute('DELETE FROM pages WHERE key IN (SELECT key FROM pages '
+                                        'ORDER BY fetched LIMIT ?)', (extra,))
+
+    """The path, size and kind ('multistream' or 'xml') of the indexed dump, None if there is none."""
+    def dumpInfo(self):
+        with self.lock:
+            meta = dict(self.connection.execute('SELECT key, value FROM dump_meta').fetchall())
+        return (meta['path'], meta['size'], meta['kind']) if 'path' in meta else None
+
+    """The title, offset and length of the title in the dump index, None if it is not there.
+    The title as it is written comes first, then a title which differs from it only in case."""
+    def findTitle(self, title):
+        with self.lock:
+            row = self.connection.execute('SELECT title, offset, length FROM dump_titles WHERE title = ?',
+                                          (titleText(title),)).fetchone()
+            if row is None:
+                row = self.connection.execute('SELECT title, offset, length FROM dump_titles WHERE key = ? '
+                                              'ORDER BY title LIMIT 1', (titleKey(title),)).fetchone()
+            return row
+
+    """The dump titles which start with the prefix."""
+    def suggest(self, prefix, limit=10):
+        key = titleKey(prefix)
+        if not key:
+            return []
+        with self.lock:
+            return [row[0] for row in self.connection.execute(
+                'SELECT title FROM dump_titles WHERE key >= ? AND key < ? ORDER BY key, title LIMIT ?',
+                (key, prefixEnd(key), limit))]
+
+    """Replace the dump index with the (title, offset, length) entries of the dump file."""
+    def writeIndex(self, path, kind, entries):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM dump_titles')
+            self.connection.execute('DELETE FROM dump_meta')
+            chunk = []
+            for title, offset, length in entries:
+                chunk.append((title, titleKey(title), offset, length))
+                if len(chunk) == INDEX_CHUNK:
+                    self.connection.executemany('INSERT OR IGNORE INTO dump_titles VALUES (?, ?, ?, ?)', chunk)
+                    chunk = []
+            self.connection.executemany('INSERT OR IGNORE INTO dump_titles VALUES (?, ?, ?, ?)', chunk)
+            count = self.connection.execute('SELECT COUNT(*) FROM dump_titles').fetchone()[0]
+            self.connection.executemany('INSERT INTO dump_meta VALUES (?, ?)',
+                                        [('path', os.path.abspath(path)), ('size', os.path.getsize(path)),
+                                         ('kind', kind), ('titles', count)])
+        return count
+
+    def close(self):
+        self.connection.close()
+
+
+"""The (title, offset, length) entries of a multistream dump from its index file (offset:id:title lines)."""
+def streamEntries(path, indexPath):
+    with bz2.open(indexPath, 'rt', encoding='utf-8') if indexPath.endswith('.bz2') else \
+            open(indexPath, encoding='utf-8') as indexFile:
+        size = os.path.getsize(path)
+        titles = []
+        streamOffset = None
+        for line in indexFile:
+            offset, _, title = line.rstrip('\n').split(':', 2)
+            offset = int(offset)
+            if offset != streamOffset:
+                for pending in titles:
+                    yield pending, streamOffset, offset - streamOffset
+                titles = []
+                streamOffset = offset
+            titles.append(title)
+        for pending in titles:
+            yield pending, streamOffset, size - streamOffset
+
+
+"""The (title, offset, length) entries of a multistream dump without its index file,
+every bz2 stream is decompressed once."""
+def scanStreams(path):
+    with open(path, 'rb') as dumpFile:
+        offset = 0
+        data = b''
+        while True:
+            decompressor = bz2.BZ2Decompressor()
+            text = []
+            consumed = 0
+            while not decompressor.eof:
+                if not data:
+                    data = dumpFile.read(READ_BLOCK)
+                    if not data:
+                        return
+                consumed += len(data)
+                text.append(decompressor.decompress(data))
+                data = b''
+            # the bytes after the end of this stream start the next one
+            data = decompressor.unused_data
+            length = consumed - len(data)
+            for title in re.findall(r'<title>(.*?)</title>', b''.join(text).decode('utf-8')):
+                yield html.unescape(title), offset, length
+            offset += length
+
+
+"""The (title, offset, length) entries of an uncompressed dump, the offset of every <page> line."""
+def scanXml(path):
+    with open(path, 'rb') as dumpFile:
+        offset = 0
+        start = title = None
+        for line in dumpFile:
+            stripped = line.strip()
+            if stripped == b'<page>':
+                start = offset
+            elif stripped.startswith(b'<title>') and start is not None:
+                title = html.unescape(stripped[7:-8].decode('utf-8'))
+            elif stripped == b'</page>' and start is not None:
+                yield title, start, offset + len(line) - start
+                start = None
+            offset += len(line)
+
+
+"""Index the dump file into the cache, return the number of titles. A .bz2 dump must be a multistream one,
+its index file (indexPath) makes the indexing a lot faster."""
+def indexDump(cache, path, indexPath=None):
+    if path.endswith('.bz2'):
+        entries = streamEntries(path, indexPath) if indexPath else scanStreams(path)
+        return cache.writeIndex(path, 'multistream', entries)
+    return cache.writeIndex(path, 'xml', scanXml(path))
+
+
+"""Finds pages in the cache, the indexed dump and online (online=False for no network)."""
+class WikiLookup:
+
+    def __init__(self, cache=None, online=True):
+        self.cache = cache if cache is not None else WikiCache()
+        self.online = online
+
+    """The WikiPage of the title read from the dump (following redirects), None if it is not in the dump."""
+    def readDump(self, title):
+        info = self.cache.dumpInfo()
+        # a dump which was changed after it was indexed is not used
+        if info is None or not os.path.exists(info[0]) or os.path.getsize(info[0]) != info[1]:
+            return None
+        path, size, kind = info
+        for _ in range(REDIRECTS + 1):
+            found = self.cache.findTitle(title)
+            if found is None:
+                return None
+            title, offset, length = found
+            with open(path, 'rb') as dumpFile:
+                dumpFile.seek(offset)
+                data = dumpFile.read(length)
+            text = bz2.decompress(data) if kind == 'multistream' else data
+            for pageTitle, redirect, wikitext in pagesOf(text.decode('utf-8')):
+                if pageTitle == title:
+                    break
+            else:
+                return None
+            if redirect is None:
+                return WikiPage(pageTitle, plainText(wikitext),
+                                'https://en.wikipedia.org/wiki/' + pageTitle.replace(' ', '_'), 'dump')
+            title = redirect
+        return None
+
+    """The WikiPage of the title, None if it is nowhere. The errors of the wikipedia package
+    (PageError, DisambiguationError) are raised as they are."""
+    def page(self, title):
+        if not title.strip():
+            return None
+        page = self.cache.getPage(title)
+        if page is not None:
+            return page
+        page = self.readDump(title)
+        if page is None and self.online and wikipedia is not None:
+            found = wikipedia.page(title)
+            page = WikiPage(found.title, found.content, found.url, 'online')
+        if page is not None:
+            self.cache.putPage(page, title)
+        return page
+
+    def suggest(self, prefix, limit=10):
+        return self.cache.suggest(prefix, limit)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='index a local Wikipedia dump and look up pages')
+    commands = parser.add_subparsers(dest='command', required=True)
+    indexCommand = commands.add_parser('index', help='index a dump (.xml or multistream .xml.bz2)')
+    indexCommand.add_argument('dump', help='the dump file')
+    indexCommand.add_argument('--index', default=None, help='the -multistream-index.txt(.bz2) of the dump')
+    lookupCommand = commands.add_parser('lookup', help='print a page')
+    lookupCommand.add_argument('title', help='the title of the page')
+    lookupCommand.add_argument('--offline', action='store_true', help='do not ask Wikipedia online')
+    parser.add_argument('--db', default=WIKI_FILE, help='the cache file')
+    args = parser.parse_args()
+
+    cache = WikiCache(args.db)
+    start = time.perf_counter()
+    if args.command == 'index':
+        print(str(indexDump(cache, args.dump, args.index)) + ' titles indexed in '
+              + str(round(time.perf_counter() - start, 1)) + ' seconds')
+    else:
+        page = WikiLookup(cache, online=not args.offline).page(args.title)
+        if page is None:
+            print('Not found, titles starting with it: ' + ', '.join(cache.suggest(args.title)))
+        else:
+            print(page.title + ' (' + page.source + ', ' + str(round((time.perf_counter() - start) * 1000, 1))
+                  + ' ms)\n' + page.content)